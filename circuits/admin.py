@@ -13,6 +13,8 @@ from django.contrib.auth.models import User
 from django.utils.html import format_html # Optional: for displaying image preview
 # --- END NEW IMPORTS ---
 
+from .image_variants import variant_url
+
 # Import all your models
 from .models import (
     Circuit,
@@ -21,6 +23,8 @@ from .models import (
     Choice,
     QuizAttempt,
     Answer,
+    LeaderboardEntry,
+    ImageVariant,
     Profile,      # <-- Added Profile
     LapTimeEntry  # <-- Added LapTimeEntry
 )
@@ -42,7 +46,8 @@ class ProfileInline(admin.StackedInline): # Use StackedInline for better layout
     def avatar_preview(self, obj):
         if obj.avatar:
             # Render a small image tag; adjust width/height as needed
-            return format_html('<img src="{}" width="100" height="100" style="object-fit: cover; border-radius: 5px;" />', obj.avatar.url)
+            # 200px variant: sharp at 100px on high-density screens, a fraction of the original's size
+            return format_html('<img src="{}" width="100" height="100" style="object-fit: cover; border-radius: 5px;" />', variant_url(obj.avatar, 200))
         return "(No avatar)"
 
 # ---------------------------------------------------
@@ -100,9 +105,23 @@ class QuestionAdmin(admin.ModelAdmin):
 @admin.register(QuizAttempt)
 class QuizAttemptAdmin(admin.ModelAdmin):
     """Admin interface customization for the QuizAttempt model."""
-    list_display = ('user', 'start_time', 'end_time', 'score')
+    list_display = ('user', 'start_time', 'end_time', 'score', 'duration_ms')
     list_filter = ('user',)
 
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    """Admin interface for the maintained leaderboard (rebuild with `manage.py rebuild_leaderboard`)."""
+    list_display = ('user', 'score', 'duration_ms', 'achieved_at')
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'attempt', 'score', 'duration_ms', 'achieved_at')
+
+@admin.register(ImageVariant)
+class ImageVariantAdmin(admin.ModelAdmin):
+    """Admin interface for generated image copies (backfill with `manage.py generate_image_variants`)."""
+    list_display = ('name', 'source', 'format', 'width', 'height', 'size')
+    list_filter = ('format', 'width')
+    search_fields = ('source',)
+
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     """Admin interface customization for the Answer model."""
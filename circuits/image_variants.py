@@ -0,0 +1,197 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Upload-time image variant pipeline. When an ImageField file
+# is saved (circuit layouts, circuits avatars, mini_fb status images) Pillow
+# writes fixed-width copies next to it, in the original format and optionally
+# in WebP, and each copy is recorded as an ImageVariant row. Templates pick the
+# smallest sufficient copy with the responsive_img tag (see
+# templatetags/image_variants.py).
+
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .models import ImageVariant
+
+logger = logging.getLogger(__name__)
+
+# Widths (px) generated for every source image that is wider than them.
+VARIANT_WIDTHS = (100, 200, 400, 800)
+
+# Also write a WebP copy of every variant (set IMAGE_VARIANTS_WEBP = False to skip).
+WEBP_ENABLED = getattr(settings, 'IMAGE_VARIANTS_WEBP', True) and features.check('webp')
+
+# Encoder options per output format.
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+VARIANTS_CACHE_KEY = 'circuits:image_variants:{}'
+
+# Resize in background threads (set IMAGE_VARIANTS_ASYNC = False to resize inline).
+ASYNC_ENABLED = getattr(settings, 'IMAGE_VARIANTS_ASYNC', True)
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+
+
+def _cache_key(source):
+    return VARIANTS_CACHE_KEY.format(hashlib.md5(source.encode()).hexdigest())
+
+
+def variant_name(source, width, fmt):
+    """Storage name of one variant, e.g. images/cat.jpg -> images/cat_200w.webp."""
+    root, _ = os.path.splitext(source)
+    return f'{root}_{width}w.{EXTENSIONS[fmt]}'
+
+
+def _encode(image, fmt):
+    """Encode a Pillow image in `fmt` and return the bytes."""
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def generate_variants(fieldfile, force=False):
+    """Create the resized copies of one ImageField file.
+
+    Does nothing if the file already has variants (unless `force`), so it is
+    safe to call on every save. Unreadable or missing files are logged and
+    skipped, never raised, since this runs from post_save receivers.
+
+    Returns:
+        list[ImageVariant]: The variants written (empty if none were needed).
+    """
+    if not fieldfile:
+        return []
+    source = fieldfile.name
+    if ImageVariant.objects.filter(source=source).exists():
+        if not force:
+            return []
+        delete_variants(fieldfile.storage, source)
+
+    try:
+        with fieldfile.storage.open(source, 'rb') as f:
+            original = Image.open(f)
+            original_format = original.format
+            original = ImageOps.exif_transpose(original)
+            original.load()
+    except FileNotFoundError:
+        logger.info('Skipping image variants for missing file %s', source)
+        return []
+    except (OSError, UnidentifiedImageError) as e:
+        logger.warning('Skipping image variants for %s: %s', source, e)
+        return []
+
+    # Photos stay JPEG; everything else (PNG layouts, GIFs, ...) becomes PNG.
+    formats = ['JPEG' if original_format in ('JPEG', 'MPO') else 'PNG']
+    if WEBP_ENABLED:
+        formats.append('WEBP')
+
+    variants = []
+    for width in VARIANT_WIDTHS:
+        if width >= original.width:
+            break
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            data = _encode(resized, fmt)
+            name = variant_name(source, width, fmt)
+            # A file already at this name is a stale, untracked copy of the same source.
+            fieldfile.storage.delete(name)
+            name = fieldfile.storage.save(name, ContentFile(data))
+            variants.append(ImageVariant(
+                source=source, source_width=original.width, name=name,
+                width=width, height=height, format=fmt, size=len(data),
+            ))
+    ImageVariant.objects.bulk_create(variants, ignore_conflicts=True)
+    cache.delete(_cache_key(source))
+    return variants
+
+
+def _generate_in_background(fieldfiles):
+    """Worker body: generate variants, then release this thread's DB connection."""
+    close_old_connections()
+    try:
+        for fieldfile in fieldfiles:
+            try:
+                generate_variants(fieldfile)
+            except Exception:
+                logger.exception('Generating image variants for %s failed', fieldfile.name)
+    finally:
+        connection.close()
+
+
+def generate_variants_async(fieldfiles):
+    """Queue variant generation for several files, off the request thread.
+
+    Used for uploads saved with bulk_create (which fires no post_save). Call
+    it from transaction.on_commit so the worker sees the committed rows.
+    """
+    fieldfiles = [f for f in fieldfiles if f]
+    if not ASYNC_ENABLED:
+        for fieldfile in fieldfiles:
+            generate_variants(fieldfile)
+        return None
+    return _executor.submit(_generate_in_background, fieldfiles)
+
+
+def delete_variants(storage, source):
+    """Delete the variant files and rows of one source file."""
+    for name in ImageVariant.objects.filter(source=source).values_list('name', flat=True):
+        storage.delete(name)
+    ImageVariant.objects.filter(source=source).delete()
+    cache.delete(_cache_key(source))
+
+
+def forget_variants(sources):
+    """Drop the cached variant lists of several source names."""
+    cache.delete_many([_cache_key(source) for source in sources])
+
+
+def variants_for(fieldfile):
+    """Return {format: [(width, url), ...]} for a file, smallest first.
+
+    The dict also holds 'source_width', the width of the original, whenever
+    the file has variants.
+
+    The lookup is cached per source file, so rendering a page of images costs
+    cache reads rather than one query per image.
+    """
+    if not fieldfile:
+        return {}
+    key = _cache_key(fieldfile.name)
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(
+            ImageVariant.objects.filter(source=fieldfile.name)
+            .order_by('width').values_list('format', 'width', 'name', 'source_width')
+        )
+        cache.set(key, rows, None)
+    found = {}
+    for fmt, width, name, source_width in rows:
+        found.setdefault(fmt, []).append((width, fieldfile.storage.url(name)))
+        found['source_width'] = source_width
+    return found
+
+
+def variant_url(fieldfile, min_width):
+    """URL of the smallest non-WebP variant at least `min_width` wide, else the original."""
+    for fmt, candidates in variants_for(fieldfile).items():
+        if fmt in ('WEBP', 'source_width'):
+            continue
+        for width, url in candidates:
+            if width >= min_width:
+                return url
+    return fieldfile.url
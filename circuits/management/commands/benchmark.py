@@ -0,0 +1,422 @@
+# circuits/management/commands/benchmark.py
+
+import http.cookiejar
+import json
+import platform
+import re
+import resource
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone as dt_timezone
+from itertools import cycle
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from circuits.models import Circuit, LeaderboardEntry
+from circuits.pagination import keyset_page
+from circuits.views import LeaderboardView
+from mini_fb.models import Profile as FbProfile
+
+from .generate_dataset import USER_PREFIX
+
+SEARCH_TERMS = ['monza', 'street', 'circuit', 'grand', 'spa', 'park']
+# Fields of the rendered quiz form, read back to build the answer POST.
+QUIZ_START_TIME = re.compile(r'name="start_time" value="([^"]+)"')
+QUIZ_QUESTION_IDS = re.compile(r'name="question_ids" value="(\d+)"')
+QUIZ_CHOICES = re.compile(r'name="question_(\d+)"[^>]*?value="(\d+)"', re.S)
+RESTAURANT_ORDERS = [
+    {'items': ['Cloud Matcha Latte'], 'extras': ['Boba Pearls']},
+    {'items': ['Brown Sugar Boba', 'Coco Water Jasmine'], 'extras': []},
+    {'items': ['Hot Supreme Matcha Latte'], 'extras': ['Grass Jelly', 'Boba Pearls']},
+]
+
+
+class QueryCounter:
+    """Counts SQL statements on every connection, including ones opened by server threads."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        connection.execute_wrappers.append(self)
+        connection_created.connect(self._on_connection, weak=False)
+
+    def _on_connection(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class ClientDriver:
+    """Sends requests in-process through django.test.Client (no sockets, CSRF not enforced)."""
+
+    name = 'client'
+
+    def __init__(self, user):
+        self.client = Client(HTTP_HOST='localhost')
+        if user is not None:
+            self.client.force_login(user)
+
+    def get(self, path, data=None):
+        response = self.client.get(path, data)
+        return response.status_code, response.content
+
+    def post(self, path, data):
+        response = self.client.post(path, data)
+        return response.status_code, response.content
+
+    def close(self):
+        pass
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class WsgiDriver:
+    """Serves the project's WSGI application on a local port and sends real HTTP requests."""
+
+    name = 'wsgi'
+
+    def __init__(self, user):
+        self.server = make_server('127.0.0.1', 0, get_wsgi_application(), handler_class=_QuietHandler)
+        self.base = f'http://localhost:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect,
+        )
+        if user is not None:
+            # Log in by creating a session, then hand its cookie to the HTTP client.
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            self._set_cookie('sessionid', client.cookies['sessionid'].value)
+
+    def _set_cookie(self, name, value):
+        self.cookies.set_cookie(http.cookiejar.Cookie(
+            0, name, value, None, False, 'localhost.local', False, False, '/', True,
+            False, None, False, None, None, {},
+        ))
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get(self, path, data=None):
+        query = f'?{urllib.parse.urlencode(data, doseq=True)}' if data else ''
+        return self._open(urllib.request.Request(self.base + path + query))
+
+    def post(self, path, data):
+        token = next((c.value for c in self.cookies if c.name == 'csrftoken'), None)
+        if token is None:
+            self.get(path)  # Any page that renders a form sets the CSRF cookie
+            token = next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+        body = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': token}, doseq=True).encode()
+        return self._open(urllib.request.Request(self.base + path, data=body, method='POST'))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects (e.g. after a POST) instead of following them, like the test client."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the hot views (circuit list/search/detail/map markers, logged in and anonymous, '
+            'quiz, leaderboard, news feed, profiles, restaurant order flow) and report latency '
+            'percentiles, throughput and query counts per scenario, plus the run\'s peak RSS, '
+            'optionally against a saved baseline.')
+
+    # Scenarios that need a logged-in user, scenarios sent without one (the
+    # anonymous pages are served from the response cache, which skips logged-in
+    # requests), and the requests per iteration of each.
+    LOGIN_REQUIRED = {'quiz', 'news_feed'}
+    ANONYMOUS = {'circuit_list_anon', 'circuit_detail_anon', 'circuit_markers_anon'}
+    STEPS = {'quiz': 2, 'leaderboard': 2, 'profile': 2, 'restaurant_order': 2}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=list(self.scenarios()),
+                            help='Run only this scenario (repeatable; default all).')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Measured iterations per scenario (default 200).')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Unmeasured iterations run first (default 20).')
+        parser.add_argument('--transport', choices=['client', 'wsgi'], default='client',
+                            help='In-process test client, or HTTP against a local WSGI server.')
+        parser.add_argument('--user', help=f'User for logged-in scenarios (default: the first "{USER_PREFIX}" user).')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the cache before every iteration.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='Compare against a JSON report saved earlier.')
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help='Relative p95 slowdown that counts as a regression (default 0.10).')
+
+    # ------------------------------------------------------------------
+    # Scenarios: each one is a generator of (method, path, data) steps;
+    # one iteration runs all steps of one scenario.
+
+    @staticmethod
+    def scenarios():
+        return {
+            'circuit_list': Command.scenario_circuit_list,
+            'circuit_search': Command.scenario_circuit_search,
+            'circuit_filter': Command.scenario_circuit_filter,
+            'circuit_detail': Command.scenario_circuit_detail,
+            'circuit_markers': Command.scenario_circuit_markers,
+            'circuit_list_anon': Command.scenario_circuit_list,
+            'circuit_detail_anon': Command.scenario_circuit_detail,
+            'circuit_markers_anon': Command.scenario_circuit_markers,
+            'quiz': Command.scenario_quiz,
+            'leaderboard': Command.scenario_leaderboard,
+            'news_feed': Command.scenario_news_feed,
+            'profile': Command.scenario_profile,
+            'restaurant_order': Command.scenario_restaurant_order,
+        }
+
+    def scenario_circuit_list(self):
+        while True:
+            yield 'get', reverse('circuits:circuit_list'), None
+
+    def scenario_circuit_search(self):
+        for term in cycle(SEARCH_TERMS):
+            yield 'get', reverse('circuits:circuit_list'), {'q': term}
+
+    def scenario_circuit_filter(self):
+        for continent in cycle(['EU', 'AS', 'NA']):
+            yield 'get', reverse('circuits:circuit_list'), {'continent': continent, 'q': 'circuit'}
+
+    def scenario_circuit_detail(self):
+        for pk in cycle(Circuit.objects.order_by('pk').values_list('pk', flat=True)[:50]):
+            yield 'get', reverse('circuits:circuit_detail', args=[pk]), None
+
+    def scenario_circuit_markers(self):
+        while True:
+            yield 'get', reverse('circuits:circuit_markers'), None
+
+    def scenario_quiz(self):
+        """GET the quiz, then POST the first choice of each question it served
+        (records one QuizAttempt per iteration)."""
+        while True:
+            yield 'get', reverse('circuits:quiz'), None
+            html = self.last_response.decode()
+            start_time = QUIZ_START_TIME.search(html)
+            data = {
+                'start_time': start_time[1] if start_time else '',
+                'question_ids': QUIZ_QUESTION_IDS.findall(html),
+            }
+            for question_id, choice_id in QUIZ_CHOICES.findall(html):
+                data.setdefault(f'question_{question_id}', choice_id)
+            yield 'post', reverse('circuits:quiz'), data
+
+    def scenario_leaderboard(self):
+        """First page, then the page after it."""
+        _, cursor = keyset_page(LeaderboardEntry.objects.all(), LeaderboardEntry.RANK_KEYS, None,
+                                LeaderboardView.page_size)
+        while True:
+            yield 'get', reverse('circuits:leaderboard'), None
+            if cursor:
+                yield 'get', reverse('circuits:leaderboard'), {'cursor': cursor}
+
+    def scenario_news_feed(self):
+        while True:
+            yield 'get', reverse('news_feed'), None
+
+    def scenario_profile(self):
+        """A mini_fb profile page and a circuits profile page, rotating over users."""
+        profiles = FbProfile.objects.filter(user__isnull=False).order_by('pk').values_list('pk', 'user__username')[:50]
+        for pk, username in cycle(profiles):
+            yield 'get', reverse('show_profile', args=[pk]), None
+            yield 'get', reverse('circuits:user_profile', args=[username]), None
+
+    def scenario_restaurant_order(self):
+        """Order page (picks the daily special), then the confirmation POST."""
+        for order in cycle(RESTAURANT_ORDERS):
+            yield 'get', reverse('order'), None
+            yield 'post', reverse('confirmation'), {
+                'name': 'Bench', 'email': 'bench@example.com', 'instructions': '', **order,
+            }
+
+    # ------------------------------------------------------------------
+
+    def handle(self, *args, **options):
+        user = self.benchmark_user(options['user'])
+        counter = QueryCounter()
+        counter.install()
+        driver_class = WsgiDriver if options['transport'] == 'wsgi' else ClientDriver
+        drivers = {}  # Logged in (False) and anonymous (True), started when first needed
+
+        report = {
+            'meta': {
+                'transport': driver_class.name,
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'cold_cache': options['cold'],
+                'user': user.username if user else None,
+                'started_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'circuits': Circuit.objects.count(),
+                'users': User.objects.count(),
+            },
+            'scenarios': {},
+        }
+        try:
+            for name in options['scenario'] or list(self.scenarios()):
+                if name in self.LOGIN_REQUIRED and user is None:
+                    self.stdout.write(self.style.WARNING(f'⚠️ {name}: skipped, no benchmark user.'))
+                    continue
+                if name == 'news_feed' and not FbProfile.objects.filter(user=user).exists():
+                    self.stdout.write(self.style.WARNING(f'⚠️ {name}: skipped, {user} has no mini_fb profile.'))
+                    continue
+                anonymous = name in self.ANONYMOUS
+                if anonymous not in drivers:
+                    drivers[anonymous] = driver_class(None if anonymous else user)
+                result = self.run_scenario(name, drivers[anonymous], counter, options)
+                report['scenarios'][name] = result
+                self.stdout.write(
+                    f"{name:<20} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+                    f"p99 {result['p99_ms']:8.2f}ms  {result['throughput_rps']:8.1f}/s  "
+                    f"{result['queries_mean']:6.1f} queries"
+                    + (f"  {result['errors']} errors" if result['errors'] else '')
+                )
+        finally:
+            for driver in drivers.values():
+                driver.close()
+        # ru_maxrss is the process-wide high-water mark (KB on Linux), so it is
+        # reported once for the whole run rather than per scenario.
+        report['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        self.stdout.write(f"peak RSS {report['peak_rss_mb']:.0f}MB")
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+            self.stdout.write(self.style.SUCCESS(f"✅ Wrote {options['output']}"))
+        else:
+            self.stdout.write(text)
+
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['threshold'])
+
+    def benchmark_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {username!r}.')
+        return User.objects.filter(username__startswith=USER_PREFIX).order_by('username').first()
+
+    def run_scenario(self, name, driver, counter, options):
+        steps = self.scenarios()[name](self)
+        per_iteration = self.STEPS.get(name, 1)
+
+        def iteration():
+            errors = 0
+            for _ in range(per_iteration):
+                try:
+                    method, path, data = next(steps)
+                except StopIteration:
+                    raise CommandError(f'{name}: nothing to benchmark in this database; '
+                                       f'seed it first with `manage.py generate_dataset`.')
+                status, self.last_response = driver.post(path, data) if method == 'post' else driver.get(path, data)
+                errors += status >= 400
+            return errors
+
+        for _ in range(options['warmup']):
+            if options['cold']:
+                cache.clear()
+            iteration()
+
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(options['iterations']):
+            if options['cold']:
+                cache.clear()
+            before = counter.count
+            t0 = time.perf_counter()
+            errors += iteration()
+            latencies.append((time.perf_counter() - t0) * 1000)
+            queries.append(counter.count - before)
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests_per_iteration': per_iteration,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'max_ms': round(latencies[-1], 3),
+            'throughput_rps': round(len(latencies) * per_iteration / elapsed, 1),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+            'errors': errors,
+        }
+
+    def compare(self, report, path, threshold):
+        """Flag scenarios whose p95 or query count got worse than in the baseline report."""
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            baseline = saved['scenarios']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
+        for key in ('transport', 'cold_cache', 'circuits', 'users'):
+            if saved.get('meta', {}).get(key) != report['meta'][key]:
+                self.stdout.write(self.style.WARNING(
+                    f"⚠️ Baseline {key} was {saved.get('meta', {}).get(key)!r}, now {report['meta'][key]!r}; "
+                    f"numbers may not be comparable."
+                ))
+
+        regressions = []
+        for name, result in report['scenarios'].items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            change = (result['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0
+            line = f"{name:<20} p95 {base['p95_ms']:.2f} -> {result['p95_ms']:.2f}ms ({change:+.0%}), " \
+                   f"queries {base['queries_mean']} -> {result['queries_mean']}"
+            if change > threshold or result['queries_mean'] > base['queries_mean']:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f'❌ {line}'))
+            else:
+                self.stdout.write(f'   {line}')
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against {path}: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f'✅ No regressions against {path}.'))
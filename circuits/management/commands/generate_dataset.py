@@ -0,0 +1,393 @@
+# circuits/management/commands/generate_dataset.py
+
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+
+from circuits import response_cache, search
+from circuits.models import (
+    F1_2024_CAR_CHOICES, MAP_MARKERS_CACHE_KEY, QUESTION_POOL_CACHE_KEY, RATING_VALUES,
+    Answer, Choice, Circuit, Comment, LapTimeEntry, LeaderboardEntry, Profile, Question, QuizAttempt,
+)
+from circuits.quiz import QUIZ_LENGTH
+from mini_fb.models import FeedEntry, Friend, Profile as FbProfile, StatusMessage, invalidate_friend_caches
+
+# Everything the generator writes is recognisable by these prefixes, so
+# --clear can remove it without touching real data.
+USER_PREFIX = 'synth_'
+CIRCUIT_PREFIX = 'Synthetic Circuit '
+QUESTION_PREFIX = 'Synthetic question '
+
+# Per-user means (statuses, comments, ...) and totals (users, circuits, questions).
+PRESETS = {
+    'small': {'users': 200, 'circuits': 24, 'questions': 30, 'friends': 10,
+              'statuses': 8, 'comments': 2, 'lap_times': 4, 'attempts': 2},
+    'medium': {'users': 5000, 'circuits': 40, 'questions': 120, 'friends': 20,
+               'statuses': 15, 'comments': 3, 'lap_times': 6, 'attempts': 3},
+    'large': {'users': 50000, 'circuits': 60, 'questions': 300, 'friends': 30,
+              'statuses': 20, 'comments': 4, 'lap_times': 8, 'attempts': 4},
+}
+
+# Fixed end of the generated time range, so the same seed gives the same rows.
+DATASET_END = datetime(2025, 5, 1, tzinfo=dt_timezone.utc)
+DATASET_DAYS = 365
+
+CITIES = ['Boston', 'London', 'Monaco', 'Milan', 'Melbourne', 'Austin', 'Tokyo', 'Montreal', 'Sao Paulo', 'Madrid']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Chris', 'Morgan', 'Jamie', 'Riley', 'Casey', 'Drew']
+LAST_NAMES = ['Smith', 'Rossi', 'Muller', 'Silva', 'Tanaka', 'Dubois', 'Novak', 'Kowalski', 'Lopez', 'Chen']
+STATUS_WORDS = ['great', 'race', 'today', 'pit', 'stop', 'overtake', 'quali', 'tyres', 'rain', 'podium',
+                'lap', 'strategy', 'safety', 'car', 'fastest', 'sector', 'grid', 'win', 'drs', 'crash']
+COMMENT_TEXTS = ['Amazing track.', 'Loved the atmosphere.', 'Hard to overtake here.', 'Great for racing.',
+                 'A classic circuit.', 'Too many slow corners.', 'The best race of the year.']
+# Skewed toward good ratings, like real reviews.
+RATING_WEIGHTS = [5, 8, 15, 32, 40]
+CARS = [value for value, _ in F1_2024_CAR_CHOICES]
+
+
+def heavy_tailed(rng, mean, cap=20):
+    """Draw a non-negative count with the given mean and a Pareto tail (capped at cap * mean)."""
+    return min(int(mean * (rng.paretovariate(2.0) - 1) + rng.random()), int(cap * mean))
+
+
+def random_time(rng, days=DATASET_DAYS):
+    return DATASET_END - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def format_lap_ms(lap_ms):
+    minutes, rest = divmod(lap_ms, 60000)
+    return f'{minutes}:{rest // 1000:02d}.{rest % 1000:03d}'
+
+
+def raw_delete(queryset):
+    """Delete `queryset` and every row that cascades from it with one plain
+    DELETE per table, children first. Unlike QuerySet.delete() no instances
+    are loaded and no per-row signals are sent, so the caller rebuilds the
+    derived tables afterwards. Returns the number of `queryset` rows deleted."""
+    model = queryset.model
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through._base_manager
+        through.filter(**{f'{field.m2m_field_name()}__in': queryset})._raw_delete(queryset.db)
+    for rel in model._meta.related_objects:
+        if rel.many_to_many:
+            through = rel.through._base_manager
+            through.filter(**{f'{rel.field.m2m_reverse_field_name()}__in': queryset})._raw_delete(queryset.db)
+            continue
+        related = rel.related_model._base_manager.filter(**{f'{rel.field.name}__in': queryset})
+        if rel.on_delete is models.CASCADE:
+            raw_delete(related)
+        elif rel.on_delete is models.SET_NULL:
+            related.update(**{rel.field.name: None})
+    return queryset._raw_delete(queryset.db)
+
+
+def friend_graph(rng, n, mean_degree):
+    """Preferential-attachment (Barabasi-Albert) edges over nodes 0..n-1.
+
+    Each new node links to m = mean_degree / 2 existing nodes chosen in
+    proportion to their degree, which yields a power-law degree distribution
+    with a few highly connected hubs.
+    """
+    m = max(1, mean_degree // 2)
+    edges = []
+    endpoints = list(range(min(m, n)))  # One entry per edge end: sampling it is degree-weighted
+    for node in range(m, n):
+        targets = set()
+        while len(targets) < m:
+            targets.add(rng.choice(endpoints))
+        for target in targets:
+            edges.append((target, node))
+            endpoints += (target, node)
+    return edges
+
+
+class Command(BaseCommand):
+    help = ('Generate a deterministic synthetic dataset (users with both profiles, a power-law '
+            'friend graph, status messages, comments, lap times and quiz attempts) with bulk inserts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(PRESETS), default='small',
+                            help='Size preset (default small).')
+        parser.add_argument('--seed', type=int, default=412, help='Random seed (default 412).')
+        parser.add_argument('--users', type=int, help='Override the preset number of users.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously generated data first.')
+        parser.add_argument('--password', default='password',
+                            help="Password of every synthetic user (default 'password').")
+        parser.add_argument('--pull-threshold', type=int, default=500,
+                            help='Profiles with more friends than this read their feed in pull mode (default 500).')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per bulk insert (default 2000).')
+
+    def handle(self, *args, **options):
+        self.preset = dict(PRESETS[options['scale']])
+        if options['users'] is not None:
+            self.preset['users'] = options['users']
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+
+        if not options['clear'] and User.objects.filter(username__startswith=USER_PREFIX).exists():
+            raise CommandError('Synthetic data already exists; rerun with --clear to replace it.')
+
+        # One transaction: if generation fails, the cleared rows come back and
+        # the derived tables are never left describing data that is gone.
+        with transaction.atomic():
+            if options['clear']:
+                self.step('clear', self.clear)
+            self.step('circuits', self.make_circuits)
+            self.step('questions', self.make_questions)
+            self.step('users', self.make_users, options['password'], options['pull_threshold'])
+            self.step('friends', self.make_friends)
+            self.step('statuses', self.make_statuses)
+            self.step('comments', self.make_comments)
+            self.step('lap times', self.make_lap_times)
+            self.step('quiz attempts', self.make_attempts)
+            self.step('derived tables', self.rebuild)
+
+    def step(self, label, func, *args):
+        started = time.perf_counter()
+        written = func(*args)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {label}: {written} rows in {time.perf_counter() - started:.1f}s.'
+        ))
+
+    def rng(self, section):
+        """A separate stream per section, so changing one preset value leaves the others' rows unchanged."""
+        return random.Random(f'{self.seed}:{section}')
+
+    def bulk(self, model, objects):
+        """bulk_create an iterable in batches; returns the number of rows written."""
+        written, batch = 0, []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+        return written + len(batch)
+
+    def insert(self, model, field_names, rows):
+        """INSERT tuples of raw field values in batches, keeping the given values
+        where bulk_create would run auto_now_add; returns the number of rows written."""
+        fields = [model._meta.get_field(name) for name in field_names]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        written, batch = 0, []
+        with connection.cursor() as cursor:
+            for row in rows:
+                batch.append([field.get_db_prep_save(value, connection) for field, value in zip(fields, row)])
+                if len(batch) >= self.batch_size:
+                    cursor.executemany(sql, batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+        return written + len(batch)
+
+    def clear(self):
+        # Bulk deletes: the receivers (rating counts, feeds, search index,
+        # caches) would otherwise run once per deleted row; the 'derived
+        # tables' step rebuilds what they maintain.
+        # Cascades to both profiles and everything they own
+        deleted = raw_delete(User.objects.filter(username__startswith=USER_PREFIX))
+        circuits = Circuit.objects.filter(name__startswith=CIRCUIT_PREFIX)
+        for circuit_id in circuits.values_list('pk', flat=True):
+            response_cache.invalidate_circuit(circuit_id, include_list=False)  # Their cached pages 404 now
+        raw_delete(circuits)
+        raw_delete(Question.objects.filter(text__startswith=QUESTION_PREFIX))
+        return deleted
+
+    # ------------------------------------------------------------------
+    # Catalog: top up circuits and questions to the preset size
+
+    def make_circuits(self):
+        rng = self.rng('circuits')
+        missing = self.preset['circuits'] - Circuit.objects.count()
+        offset = Circuit.objects.filter(name__startswith=CIRCUIT_PREFIX).count()
+        circuits = [
+            Circuit(
+                name=f'{CIRCUIT_PREFIX}{offset + i + 1}', location=rng.choice(CITIES),
+                latitude=round(rng.uniform(-45, 60), 4), longitude=round(rng.uniform(-120, 150), 4),
+                fun_fact='Generated for load testing.', number_of_laps=rng.randint(44, 78),
+                first_grand_prix=rng.randint(1950, 2023), continent=rng.choice(['EU', 'AS', 'NA', 'SA', 'OC']),
+            )
+            for i in range(max(0, missing))
+        ]
+        return self.bulk(Circuit, circuits)
+
+    def make_questions(self):
+        rng = self.rng('questions')
+        missing = self.preset['questions'] - Question.objects.filter(choices__isnull=False).distinct().count()
+        if missing <= 0:
+            return 0
+        offset = Question.objects.filter(text__startswith=QUESTION_PREFIX).count()
+        texts = [f'{QUESTION_PREFIX}{offset + i + 1}?' for i in range(missing)]
+        self.bulk(Question, (Question(text=text) for text in texts))
+        question_ids = Question.objects.filter(text__in=texts).values_list('pk', flat=True)
+        choices = []
+        for question_id in question_ids:
+            correct = rng.randrange(4)
+            choices += [Choice(question_id=question_id, text=f'Option {c + 1}', is_correct=c == correct)
+                        for c in range(4)]
+        return missing + self.bulk(Choice, choices)
+
+    # ------------------------------------------------------------------
+    # Users and the social graph
+
+    def make_users(self, password, pull_threshold):
+        rng = self.rng('users')
+        n = self.preset['users']
+        hashed = make_password(password)  # Hashing is slow; every synthetic user shares one hash
+        joined = [random_time(rng, DATASET_DAYS * 2) for _ in range(n)]
+        written = self.bulk(User, (
+            User(username=f'{USER_PREFIX}{i:06d}', email=f'{USER_PREFIX}{i:06d}@example.com',
+                 password=hashed, date_joined=joined[i])
+            for i in range(n)
+        ))
+        # SQLite bulk_create does not return pks; read them back once, in index order.
+        self.user_ids = list(User.objects.filter(username__startswith=USER_PREFIX)
+                             .order_by('username').values_list('pk', flat=True))
+
+        # The graph decides which profiles are hubs, so build it before the profiles.
+        self.edges = friend_graph(self.rng('friends'), n, self.preset['friends'])
+        degree = [0] * n
+        for a, b in self.edges:
+            degree[a] += 1
+            degree[b] += 1
+
+        written += self.bulk(Profile, (Profile(user_id=user_id) for user_id in self.user_ids))
+        written += self.bulk(FbProfile, (
+            FbProfile(
+                user_id=user_id, email=f'{USER_PREFIX}{i:06d}@example.com',
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES), city=rng.choice(CITIES),
+                feed_fan_out=degree[i] <= pull_threshold,
+            )
+            for i, user_id in enumerate(self.user_ids)
+        ))
+        self.profile_ids = list(FbProfile.objects.filter(email__startswith=USER_PREFIX)
+                                .order_by('email').values_list('pk', flat=True))
+        return written
+
+    def make_friends(self):
+        ids = self.profile_ids
+        written = self.bulk(Friend, (Friend(profile1_id=ids[a], profile2_id=ids[b]) for a, b in self.edges))
+        # bulk_create sends no post_save, so drop the cached friend ids and suggestions here
+        invalidate_friend_caches(ids)
+        return written
+
+    def make_statuses(self):
+        rng = self.rng('statuses')
+        mean = self.preset['statuses']
+        statuses = (
+            (profile_id, random_time(rng), ' '.join(rng.choices(STATUS_WORDS, k=rng.randint(3, 15))).capitalize())
+            for profile_id in self.profile_ids
+            for _ in range(heavy_tailed(rng, mean))
+        )
+        # A plain INSERT keeps the generated timestamps; auto_now_add would overwrite them.
+        return self.insert(StatusMessage, ('profile', 'timestamp', 'message'), statuses)
+
+    # ------------------------------------------------------------------
+    # Circuit activity
+
+    def circuit_weights(self):
+        """Circuit ids with Zipf-like popularity weights (the first circuits are the most visited)."""
+        ids = list(Circuit.objects.order_by('pk').values_list('pk', flat=True))
+        return ids, [1 / (rank + 1) for rank in range(len(ids))]
+
+    def pick_circuits(self, rng, ids, weights, k):
+        picked = set()
+        for _ in range(k * 3):
+            if len(picked) >= min(k, len(ids)):
+                break
+            picked.add(rng.choices(ids, weights)[0])
+        return sorted(picked)  # Sets iterate by hash; keep the draw order independent of the pk values
+
+    def make_comments(self):
+        rng = self.rng('comments')
+        ids, weights = self.circuit_weights()
+        if not ids:
+            return 0
+        comments = (
+            (user_id, circuit_id, rng.choice(COMMENT_TEXTS),
+             rng.choices(RATING_VALUES, RATING_WEIGHTS)[0], random_time(rng))
+            for user_id in self.user_ids
+            for circuit_id in self.pick_circuits(rng, ids, weights, heavy_tailed(rng, self.preset['comments']))
+        )
+        return self.insert(Comment, ('user', 'circuit', 'text', 'rating', 'created_at'), comments)
+
+    def make_lap_times(self):
+        rng = self.rng('lap_times')
+        ids, weights = self.circuit_weights()
+        base_ms = {circuit_id: rng.randint(68000, 105000) for circuit_id in ids}
+        entries = []
+        for user_id in self.user_ids:
+            skill = rng.uniform(0.0, 0.08)  # Fraction slower than the circuit's base time
+            for circuit_id in self.pick_circuits(rng, ids, weights, heavy_tailed(rng, self.preset['lap_times'])):
+                lap_ms = int(base_ms[circuit_id] * (1 + skill + abs(rng.gauss(0, 0.01))))
+                entries.append(LapTimeEntry(circuit_id=circuit_id, user_id=user_id, car=rng.choice(CARS),
+                                            lap_time=format_lap_ms(lap_ms), lap_ms=lap_ms))
+        return self.bulk(LapTimeEntry, entries)
+
+    def make_attempts(self):
+        rng = self.rng('attempts')
+        choices = {}
+        for question_id, choice_id, is_correct in Choice.objects.order_by('pk').values_list('question_id', 'pk', 'is_correct'):
+            choices.setdefault(question_id, []).append((choice_id, is_correct))
+        pool = sorted(choices)
+        if not pool:
+            return 0
+
+        written = 0
+        users_per_batch = max(1, self.batch_size // 10)  # Each user brings a few attempts of QUIZ_LENGTH answers
+        for start in range(0, len(self.user_ids), users_per_batch):
+            attempts, answers = [], []
+            for user_id in self.user_ids[start:start + users_per_batch]:
+                skill = rng.betavariate(2, 2)  # Chance of answering a question correctly
+                for _ in range(heavy_tailed(rng, self.preset['attempts'])):
+                    picked = []
+                    for question_id in rng.sample(pool, min(QUIZ_LENGTH, len(pool))):
+                        correct = [c for c in choices[question_id] if c[1]]
+                        wrong = [c for c in choices[question_id] if not c[1]]
+                        choice = rng.choice(correct if correct and (rng.random() < skill or not wrong) else wrong)
+                        picked.append((question_id, *choice))
+                    duration_ms = rng.randint(20000, 180000)
+                    end_time = random_time(rng)
+                    attempts.append(QuizAttempt(
+                        user_id=user_id, start_time=end_time - timedelta(milliseconds=duration_ms),
+                        end_time=end_time, duration_ms=duration_ms, score=sum(c[2] for c in picked),
+                    ))
+                    answers.append(picked)
+            QuizAttempt.objects.bulk_create(attempts)
+            # No pks back from SQLite: the batch is the newest len(attempts) rows, in insert order.
+            attempt_ids = list(QuizAttempt.objects.order_by('-pk').values_list('pk', flat=True)[:len(attempts)])[::-1]
+            written += len(attempts) + self.bulk(Answer, (
+                Answer(attempt_id=attempt_id, question_id=question_id,
+                       selected_choice_id=choice_id, is_correct=is_correct)
+                for attempt_id, picked in zip(attempt_ids, answers)
+                for question_id, choice_id, is_correct in picked
+            ))
+        return written
+
+    # ------------------------------------------------------------------
+    # Everything the post_save receivers would have maintained
+
+    def rebuild(self):
+        Circuit.rebuild_rating_aggregates()
+        written = LeaderboardEntry.rebuild()
+        written += FeedEntry.rebuild(batch_size=self.batch_size)
+        if search.fts_available():
+            written += search.rebuild_index(Circuit.objects.values('pk', *search.FTS_COLUMNS).iterator())
+        transaction.on_commit(lambda: cache.delete_many([MAP_MARKERS_CACHE_KEY, QUESTION_POOL_CACHE_KEY]))
+        for circuit_id in Circuit.objects.values_list('pk', flat=True):
+            response_cache.invalidate_circuit(circuit_id, include_list=False)
+        response_cache.invalidate_list()
+        return written
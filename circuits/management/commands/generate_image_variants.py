@@ -0,0 +1,40 @@
+# circuits/management/commands/generate_image_variants.py
+
+from django.core.management.base import BaseCommand
+
+from circuits.image_variants import generate_variants
+from circuits.models import Circuit, Profile
+from mini_fb.models import Image
+
+# Every ImageField whose uploads get resized copies.
+IMAGE_FIELDS = [
+    (Circuit, 'layout_image'),
+    (Profile, 'avatar'),
+    (Image, 'image_file'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate resized (and WebP) variants for existing uploaded images under media/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate variants even for files that already have them.')
+
+    def handle(self, *args, **options):
+        seen = set()
+        processed = written = 0
+        for model, field_name in IMAGE_FIELDS:
+            field = model._meta.get_field(field_name)
+            names = (model.objects.exclude(**{field_name: ''})
+                     .values_list(field_name, flat=True).distinct().iterator())
+            for name in names:
+                if name in seen:  # e.g. the shared default avatar
+                    continue
+                seen.add(name)
+                fieldfile = field.attr_class(None, field, name)
+                written += len(generate_variants(fieldfile, force=options['force']))
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Checked {processed} image(s), wrote {written} variant file(s).'
+        ))
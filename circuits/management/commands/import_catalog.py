@@ -0,0 +1,336 @@
+# circuits/management/commands/import_catalog.py
+
+import json
+import os
+import time
+
+import tablib
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from circuits import response_cache, search
+from circuits.image_variants import generate_variants
+from circuits.models import (
+    F1_2024_CAR_CHOICES, LAP_TIME_PATTERN, MAP_MARKERS_CACHE_KEY, QUESTION_POOL_CACHE_KEY,
+    Choice, Circuit, LapTimeEntry, Question,
+)
+
+# Circuit columns that may be imported; 'name' is the upsert key.
+CIRCUIT_FIELDS = [
+    'name', 'location', 'latitude', 'longitude', 'layout_image', 'record_lap_info',
+    'introduction', 'fun_fact', 'first_grand_prix', 'number_of_laps', 'circuit_length',
+    'race_distance', 'continent', 'most_wins_driver', 'most_wins_count',
+]
+CAR_NAMES = {value for value, _ in F1_2024_CAR_CHOICES}
+
+# Number of change lines printed in the diff report (all of them with -v 2).
+DIFF_LINES = 20
+
+
+def load_rows(path):
+    """Read a .csv, .xlsx or .json file into a list of dicts (JSON keeps nested values)."""
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if ext == 'json':
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+        if not isinstance(rows, list):
+            raise CommandError('A JSON import file must hold a list of objects.')
+        return rows
+    if ext not in ('csv', 'xlsx'):
+        raise CommandError(f'Unsupported file type: {path} (use .csv, .xlsx or .json).')
+    with open(path, 'rb' if ext == 'xlsx' else 'r', **({} if ext == 'xlsx' else {'encoding': 'utf-8-sig'})) as f:
+        dataset = tablib.Dataset().load(f.read(), format=ext)
+    return [dict(row) for row in dataset.dict]
+
+
+def blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = ('Upsert circuits (by name), quiz questions with their choices (by question text) '
+            'or lap times (by circuit, user and car) from a CSV, XLSX or JSON file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['circuits', 'questions', 'lap_times'])
+        parser.add_argument('path', help='File to import (.csv, .xlsx or .json).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only print the diff report; write nothing.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows looked up and written per batch (default 1000).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = load_rows(options['path'])
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.changes = []
+
+        importer = getattr(self, f"import_{options['kind']}")
+        with transaction.atomic():
+            counts = importer(rows)
+
+        self.report(options['kind'], counts, time.perf_counter() - started)
+
+    # ------------------------------------------------------------------
+    # Report
+
+    def change(self, line):
+        """Record one line of the diff report."""
+        self.changes.append(line)
+
+    def report(self, kind, counts, elapsed):
+        shown = self.changes if self.verbosity >= 2 else self.changes[:DIFF_LINES]
+        for line in shown:
+            self.stdout.write(line)
+        if len(shown) < len(self.changes):
+            self.stdout.write(f'  ... and {len(self.changes) - len(shown)} more (use -v 2 to list all)')
+        summary = (f"{kind}: {counts['create']} new, {counts['update']} changed, "
+                   f"{counts['unchanged']} unchanged, {counts['invalid']} invalid ({elapsed:.2f}s)")
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING(f'⚠️ Dry run, nothing written. {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Imported {summary}'))
+
+    def invalid(self, counts, row_number, message):
+        counts['invalid'] += 1
+        self.stdout.write(self.style.ERROR(f'❌ Row {row_number}: {message}'))
+
+    # ------------------------------------------------------------------
+    # Circuits
+
+    def import_circuits(self, rows):
+        counts = {'create': 0, 'update': 0, 'unchanged': 0, 'invalid': 0}
+        fields = {name: Circuit._meta.get_field(name) for name in CIRCUIT_FIELDS}
+        continents = {code for code, _ in fields['continent'].choices}
+
+        parsed = {}
+        for number, row in enumerate(rows, start=2):
+            values = {}
+            try:
+                for name, field in fields.items():
+                    if name in row and not blank(row[name]):
+                        raw = row[name].strip() if isinstance(row[name], str) else row[name]
+                        values[name] = raw if name == 'layout_image' else field.to_python(raw)
+            except ValidationError as e:
+                self.invalid(counts, number, f'{name}: {"; ".join(e.messages)}')
+                continue
+            if 'name' not in values:
+                self.invalid(counts, number, 'missing name')
+            elif 'continent' in values and values['continent'] not in continents:
+                self.invalid(counts, number, f"unknown continent {values['continent']!r}")
+            else:
+                parsed[values['name']] = (number, values)  # A repeated name: the last row wins
+
+        touched_ids, new_layouts = [], set()
+        for batch in chunks(list(parsed.values()), self.batch_size):
+            existing = {}
+            for circuit in Circuit.objects.filter(name__in=[v['name'] for _, v in batch]).order_by('-pk'):
+                existing[circuit.name] = circuit  # Duplicate names: keep the oldest row
+
+            to_create, to_update, changed_fields = [], [], set()
+            for number, values in batch:
+                circuit = existing.get(values['name'])
+                if circuit is None:
+                    for name in ('location', 'latitude', 'longitude'):
+                        if name not in values:
+                            self.invalid(counts, number, f"new circuit {values['name']!r} needs {name}")
+                            break
+                    else:
+                        to_create.append(Circuit(**values))
+                        self.change(f"+ circuit {values['name']!r}")
+                    continue
+                diff = {
+                    name: value for name, value in values.items()
+                    if (getattr(circuit, name).name if name == 'layout_image' else getattr(circuit, name)) != value
+                }
+                if not diff:
+                    counts['unchanged'] += 1
+                    continue
+                for name, value in diff.items():
+                    old = getattr(circuit, name)
+                    self.change(f"~ circuit {circuit.name!r}: {name} {str(old)[:40]!r} -> {str(value)[:40]!r}")
+                    setattr(circuit, name, value)
+                to_update.append(circuit)
+                changed_fields.update(diff)
+
+            counts['create'] += len(to_create)
+            counts['update'] += len(to_update)
+            new_layouts.update(c.layout_image.name for c in to_create + to_update
+                               if c.layout_image and (c.pk is None or 'layout_image' in changed_fields))
+            if not self.dry_run:
+                Circuit.objects.bulk_create(to_create)
+                if to_update:
+                    Circuit.objects.bulk_update(to_update, sorted(changed_fields))
+                touched_ids += [c.pk for c in to_update]
+
+        if not self.dry_run and (counts['create'] or counts['update']):
+            # bulk writes skip the post_save receivers; redo their work once.
+            if search.fts_available():
+                search.rebuild_index(Circuit.objects.values('pk', *search.FTS_COLUMNS).iterator())
+            transaction.on_commit(lambda: self.invalidate_circuits(touched_ids, include_list=True))
+            if new_layouts:
+                names = sorted(new_layouts)
+                transaction.on_commit(lambda: [
+                    generate_variants(c.layout_image) for c in Circuit.objects.filter(layout_image__in=names)
+                ])
+        return counts
+
+    # ------------------------------------------------------------------
+    # Questions and choices
+
+    def import_questions(self, rows):
+        """Rows are either nested ({"text", "choices": [{"text", "is_correct"}]})
+        or flat, one choice per row ({"question", "choice", "is_correct"})."""
+        counts = {'create': 0, 'update': 0, 'unchanged': 0, 'invalid': 0}
+        questions = {}
+        for number, row in enumerate(rows, start=2):
+            text = row.get('text') if 'choices' in row else row.get('question')
+            if blank(text):
+                self.invalid(counts, number, 'missing question text')
+                continue
+            if isinstance(text, (list, dict)):
+                self.invalid(counts, number, f'question text must be a string, not {type(text).__name__}')
+                continue
+            choices = row['choices'] if 'choices' in row else [{'text': row.get('choice'), 'is_correct': row.get('is_correct')}]
+            bucket = questions.setdefault(str(text).strip(), {})
+            for choice in choices:
+                if blank(choice.get('text')):
+                    self.invalid(counts, number, 'missing choice text')
+                    continue
+                bucket[str(choice['text']).strip()] = str(choice.get('is_correct')).strip().lower() in ('1', 'true', 'yes', 'y', 'x')
+
+        for batch in chunks(list(questions.items()), self.batch_size):
+            texts = [text for text, _ in batch]
+            question_ids = dict(Question.objects.filter(text__in=texts).order_by('-pk').values_list('text', 'pk'))
+            new_texts = [text for text in texts if text not in question_ids]
+            for text in new_texts:
+                self.change(f'+ question {text[:60]!r} ({len(questions[text])} choices)')
+            counts['create'] += len(new_texts)
+            if not self.dry_run and new_texts:
+                Question.objects.bulk_create([Question(text=text) for text in new_texts])
+                question_ids.update(Question.objects.filter(text__in=new_texts).order_by('-pk').values_list('text', 'pk'))
+
+            existing = {}
+            for choice in Choice.objects.filter(question_id__in=[question_ids[t] for t in texts if t in question_ids]):
+                existing[(choice.question_id, choice.text)] = choice
+
+            to_create, to_update = [], []
+            for text, choices in batch:
+                qid = question_ids.get(text)
+                changed = False
+                for choice_text, is_correct in choices.items():
+                    choice = existing.get((qid, choice_text))
+                    if choice is None:
+                        to_create.append(Choice(question_id=qid, text=choice_text, is_correct=is_correct))
+                        changed = changed or text not in new_texts
+                        if text not in new_texts:
+                            self.change(f'~ question {text[:60]!r}: + choice {choice_text!r}')
+                    elif choice.is_correct != is_correct:
+                        choice.is_correct = is_correct
+                        to_update.append(choice)
+                        changed = True
+                        self.change(f'~ question {text[:60]!r}: choice {choice_text!r} is_correct -> {is_correct}')
+                if text not in new_texts:
+                    counts['update' if changed else 'unchanged'] += 1
+
+            if not self.dry_run:
+                Choice.objects.bulk_create(to_create)
+                Choice.objects.bulk_update(to_update, ['is_correct'])
+
+        if not self.dry_run:
+            transaction.on_commit(lambda: cache.delete(QUESTION_POOL_CACHE_KEY))
+        return counts
+
+    # ------------------------------------------------------------------
+    # Lap times
+
+    def import_lap_times(self, rows):
+        counts = {'create': 0, 'update': 0, 'unchanged': 0, 'invalid': 0}
+
+        # Validate the whole lap-time column in one pass before touching the database.
+        lap_times = [str(row.get('lap_time') or '').strip() for row in rows]
+        matches = [LAP_TIME_PATTERN.match(value) for value in lap_times]
+        bad = {i for i, match in enumerate(matches) if match is None}
+        for i in sorted(bad):
+            self.invalid(counts, i + 2, f'invalid lap time {lap_times[i]!r} (use MM:SS.mmm or SS.mmm)')
+        cars = [str(row.get('car') or '').strip() for row in rows]
+        bad_cars = [i for i, car in enumerate(cars) if car not in CAR_NAMES and i not in bad]
+        for i in bad_cars:
+            self.invalid(counts, i + 2, f'unknown car {cars[i]!r}')
+        skip = bad | set(bad_cars)
+        # Same arithmetic as parse_lap_time(), on the matches already in hand.
+        lap_ms = [
+            None if match is None else (int(match[1] or 0) * 60 + int(match[2])) * 1000 + int(match[3])
+            for match in matches
+        ]
+
+        parsed = {}
+        for i, row in enumerate(rows):
+            if i not in skip:
+                key = (str(row.get('circuit')).strip(), str(row.get('user')).strip(), cars[i])
+                parsed[key] = (i + 2, lap_times[i], lap_ms[i])  # A repeated key: the last row wins
+
+        touched_circuits = set()
+        for batch in chunks(list(parsed.items()), self.batch_size):
+            circuit_ids = {}
+            for name, pk in Circuit.objects.filter(name__in={k[0] for k, _ in batch}).order_by('-pk').values_list('name', 'pk'):
+                circuit_ids[name] = pk
+            user_ids = dict(User.objects.filter(username__in={k[1] for k, _ in batch}).values_list('username', 'pk'))
+            existing = {
+                (entry.circuit_id, entry.user_id, entry.car): entry
+                for entry in LapTimeEntry.objects.filter(
+                    circuit_id__in=circuit_ids.values(), user_id__in=user_ids.values()
+                ).only('id', 'circuit_id', 'user_id', 'car', 'lap_time', 'lap_ms')
+            }
+
+            to_create, to_update = [], []
+            for (circuit_name, username, car), (number, lap_time, ms) in batch:
+                circuit_id, user_id = circuit_ids.get(circuit_name), user_ids.get(username)
+                if circuit_id is None or user_id is None:
+                    self.invalid(counts, number, f'unknown {"circuit" if circuit_id is None else "user"} '
+                                                 f'{circuit_name if circuit_id is None else username!r}')
+                    continue
+                entry = existing.get((circuit_id, user_id, car))
+                label = f'{circuit_name} / {username} / {car}'
+                if entry is None:
+                    to_create.append(LapTimeEntry(circuit_id=circuit_id, user_id=user_id, car=car,
+                                                  lap_time=lap_time, lap_ms=ms))
+                    self.change(f'+ lap time {label}: {lap_time}')
+                elif entry.lap_ms != ms:
+                    self.change(f'~ lap time {label}: {entry.lap_time} -> {lap_time}')
+                    entry.lap_time, entry.lap_ms = lap_time, ms
+                    to_update.append(entry)
+                else:
+                    counts['unchanged'] += 1
+                    continue
+                touched_circuits.add(circuit_id)
+
+            counts['create'] += len(to_create)
+            counts['update'] += len(to_update)
+            if not self.dry_run:
+                LapTimeEntry.objects.bulk_create(to_create)
+                LapTimeEntry.objects.bulk_update(to_update, ['lap_time', 'lap_ms'])
+
+        if not self.dry_run:
+            transaction.on_commit(lambda: self.invalidate_circuits(touched_circuits))
+        return counts
+
+    @staticmethod
+    def invalidate_circuits(circuit_ids, include_list=False):
+        """Expire cached pages of the imported circuits. Runs after the import
+        commits, so no request can re-cache a page read before it."""
+        if include_list:
+            cache.delete(MAP_MARKERS_CACHE_KEY)
+            response_cache.invalidate_list()
+        for pk in circuit_ids:
+            response_cache.invalidate_circuit(pk, include_list=False)
@@ -0,0 +1,69 @@
+# circuits/management/commands/merge_profiles.py
+
+import os
+import pstats
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from circuits.sampling import MERGED_DIR, profiler_settings
+
+
+class Command(BaseCommand):
+    help = ('Merge the sampling profiler output into one file per route: '
+            '<route>.collapsed (flamegraph.pl / speedscope input) and <route>.pstats.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Profile directory (default: SAMPLING_PROFILER["DIR"]).')
+        parser.add_argument('--output', help='Where merged files go (default: <dir>/merged).')
+        parser.add_argument('--route', action='append', default=[],
+                            help="Only merge this URL name, e.g. 'circuits:circuit_detail' (repeatable).")
+        parser.add_argument('--delete', action='store_true', help='Delete the samples once merged.')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or profiler_settings()['DIR']
+        output = options['output'] or os.path.join(directory, MERGED_DIR)
+        if not os.path.isdir(directory):
+            raise CommandError(f'No profiles in {directory}; is SAMPLING_PROFILER enabled?')
+        routes = {route.replace(':', '.') for route in options['route']}
+
+        os.makedirs(output, exist_ok=True)
+        merged = 0
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+            if not entry.is_dir() or entry.name == MERGED_DIR or (routes and entry.name not in routes):
+                continue
+            files = sorted(f.path for f in os.scandir(entry.path) if f.is_file())
+            collapsed = [f for f in files if f.endswith('.collapsed')]
+            profiles = [f for f in files if f.endswith('.pstats')]
+
+            if collapsed:
+                stacks = self.merge_collapsed(collapsed)
+                with open(os.path.join(output, f'{entry.name}.collapsed'), 'w') as f:
+                    for stack, n in sorted(stacks.items()):
+                        f.write(f'{stack} {n}\n')
+                self.stdout.write(f'{entry.name}: {len(collapsed)} request(s), {sum(stacks.values())} samples')
+            if profiles:
+                stats = pstats.Stats(*profiles)
+                stats.dump_stats(os.path.join(output, f'{entry.name}.pstats'))
+                self.stdout.write(f'{entry.name}: {len(profiles)} cProfile run(s), {stats.total_tt:.3f}s total')
+
+            if options['delete']:
+                for name in collapsed + profiles:
+                    os.remove(name)
+            merged += len(collapsed) + len(profiles)
+
+        if not merged:
+            self.stdout.write(self.style.WARNING(f'⚠️ Nothing to merge in {directory}.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'✅ Merged {merged} profile(s) into {output}.'))
+
+    @staticmethod
+    def merge_collapsed(paths):
+        stacks = Counter()
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    stack, _, n = line.rstrip('\n').rpartition(' ')
+                    if stack and n.isdigit():
+                        stacks[stack] += int(n)
+        return stacks
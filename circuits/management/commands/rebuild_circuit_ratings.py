@@ -0,0 +1,15 @@
+# circuits/management/commands/rebuild_circuit_ratings.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from circuits.models import Circuit
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating count, sum and per-star histogram of every circuit from its comments.'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            updated = Circuit.rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt rating aggregates for {updated} circuits.'))
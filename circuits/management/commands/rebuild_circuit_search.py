@@ -0,0 +1,20 @@
+# circuits/management/commands/rebuild_circuit_search.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from circuits import search
+from circuits.models import Circuit
+
+
+class Command(BaseCommand):
+    help = 'Re-index every circuit in the SQLite FTS5 full-text search table.'
+
+    def handle(self, *args, **kwargs):
+        if not search.fts_available():
+            raise CommandError('Full-text search requires the SQLite database backend.')
+
+        circuits = Circuit.objects.values('pk', *search.FTS_COLUMNS).iterator()
+        with transaction.atomic():
+            indexed = search.rebuild_index(circuits)
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {indexed} circuits for search.'))
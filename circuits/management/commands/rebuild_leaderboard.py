@@ -0,0 +1,15 @@
+# circuits/management/commands/rebuild_leaderboard.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from circuits.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the quiz leaderboard table from every user's best QuizAttempt."
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            written = LeaderboardEntry.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt leaderboard with {written} entries.'))
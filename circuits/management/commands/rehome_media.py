@@ -0,0 +1,127 @@
+# circuits/management/commands/rehome_media.py
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from circuits.image_variants import forget_variants
+from circuits.models import ImageVariant
+from circuits.storage import ContentAddressedStorage, is_hashed_name
+
+from .generate_image_variants import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = ('Move uploaded images from the flat media/ directories into content-addressed '
+            "storage ('ab/cd/<sha256>.<ext>'), storing duplicate files once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be moved without changing anything.')
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Leave the old files in place after re-homing them.')
+        parser.add_argument('--prune', action='store_true',
+                            help='Also delete content-addressed files that nothing references.')
+        parser.add_argument('--prune-grace', type=float, default=24, metavar='HOURS',
+                            help='Never prune files written in the last HOURS hours, which may '
+                                 'belong to uploads not committed yet (default 24).')
+
+    def handle(self, *args, **options):
+        storage = IMAGE_FIELDS[0][0]._meta.get_field(IMAGE_FIELDS[0][1]).storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError('Content-addressed media is disabled (CONTENT_ADDRESSED_MEDIA = False).')
+
+        # Field defaults (e.g. the shared default avatar) must stay where new rows expect them.
+        defaults = {model._meta.get_field(field).default for model, field in IMAGE_FIELDS}
+
+        old_names = set(ImageVariant.objects.values_list('name', flat=True))
+        for model, field in IMAGE_FIELDS:
+            old_names.update(model.objects.exclude(**{field: ''}).values_list(field, flat=True).distinct())
+        old_names = sorted(name for name in old_names if not is_hashed_name(name))
+
+        mapping, missing, old_bytes = {}, 0, 0
+        for name in old_names:
+            if not storage.exists(name):
+                missing += 1
+                continue
+            old_bytes += storage.size(name)
+            if options['dry_run']:
+                mapping[name] = None
+                continue
+            with storage.open(name, 'rb') as f:
+                mapping[name] = storage.save(name, f)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ Dry run: would re-home {len(mapping)} file(s) ({old_bytes} bytes); {missing} missing.'
+            ))
+            return
+
+        with transaction.atomic():
+            for model, field in IMAGE_FIELDS:
+                for old, new in mapping.items():
+                    model.objects.filter(**{field: old}).update(**{field: new})
+            self._rehome_variants(mapping)
+
+        if not options['keep_originals']:
+            for name in mapping:
+                if name not in defaults:
+                    storage.delete(name)
+
+        unique = set(mapping.values())
+        new_bytes = sum(storage.size(name) for name in unique)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Re-homed {len(mapping)} file(s) into {len(unique)} unique file(s), '
+            f'saving {old_bytes - new_bytes} bytes; {missing} missing.'
+        ))
+        if options['prune']:
+            self._prune(storage, options['prune_grace'])
+
+    def _rehome_variants(self, mapping):
+        """Point ImageVariant rows at the new names, dropping rows that became duplicates."""
+        keep, drop = {}, []
+        variants = ImageVariant.objects.filter(source__in=list(mapping)) | ImageVariant.objects.filter(name__in=list(mapping))
+        for variant in variants.order_by('id'):
+            variant.source = mapping.get(variant.source, variant.source)
+            variant.name = mapping.get(variant.name, variant.name)
+            key = (variant.source, variant.width, variant.format)
+            if key in keep:
+                drop.append(variant.pk)
+            else:
+                keep[key] = variant
+        # Rewrite the kept rows (same ids) so renames cannot collide on the unique key.
+        ImageVariant.objects.filter(pk__in=drop + [v.pk for v in keep.values()]).delete()
+        ImageVariant.objects.bulk_create(keep.values(), batch_size=500)
+        forget_variants({variant.source for variant in keep.values()})
+
+    def _prune(self, storage, grace_hours):
+        """Delete content-addressed files that no image field or variant refers to.
+
+        Files modified within the grace period are kept: an upload is stored
+        before its row commits, so it is briefly unreferenced.
+        """
+        cutoff = time.time() - grace_hours * 3600
+        referenced = set(ImageVariant.objects.values_list('name', flat=True))
+        for model, field in IMAGE_FIELDS:
+            referenced.update(model.objects.values_list(field, flat=True).distinct())
+
+        pruned = recent = 0
+        for root, _, files in os.walk(storage.location):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                if not is_hashed_name(name) or name in referenced:
+                    continue
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        recent += 1
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                pruned += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Pruned {pruned} unreferenced file(s); kept {recent} written in the last {grace_hours:g}h.'
+        ))
@@ -0,0 +1,228 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Request metrics in the Prometheus text format, served by
+# the circuits:metrics view. ProfilingMiddleware calls observe() once per
+# request. Counters live in SHARD_COUNT lock-striped shards and each thread
+# is given one in turn, so concurrent requests rarely wait on the same lock;
+# the shards are only summed when the endpoint is scraped. Their number is
+# fixed, so thread-per-request servers do not grow it.
+# With several worker processes, set METRICS['MULTIPROCESS_DIR']: every
+# process then writes its totals to <dir>/<pid>.json every FLUSH_INTERVAL
+# seconds and the endpoint adds up all the files.
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from itertools import count
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+from .response_cache import cache_stats
+
+# Upper bounds of the histogram buckets (Prometheus 'le' labels).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+HISTOGRAMS = (
+    ('latency', 'http_request_duration_seconds', 'Request latency in seconds, by URL name.', LATENCY_BUCKETS),
+    ('queries', 'http_db_queries', 'SQL queries per request, by URL name.', QUERY_BUCKETS),
+    ('size', 'http_response_size_bytes', 'Response body size in bytes, by URL name.', SIZE_BUCKETS),
+)
+
+DEFAULTS = {
+    'TOKEN': None,              # Scrapers send 'Authorization: Bearer <token>'; without one, staff only
+    'MULTIPROCESS_DIR': None,
+    'FLUSH_INTERVAL': 5,        # Seconds between writes of this process's totals
+    'TABLES': ['circuits.QuizAttempt', 'circuits.Answer', 'mini_fb.StatusMessage', 'mini_fb.Friend'],
+    'TABLE_SIZES_TTL': 60,      # Seconds the table row counts are cached
+}
+TABLE_SIZES_CACHE_KEY = 'circuits:metrics:table_sizes'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class RouteMetrics:
+    """Counters for one URL name in one shard; histogram buckets are not cumulative."""
+
+    def __init__(self):
+        self.requests = {}  # status code -> count
+        self.buckets = {key: [0] * (len(bounds) + 1) for key, _, _, bounds in HISTOGRAMS}
+        self.sums = {key: 0 for key, _, _, _ in HISTOGRAMS}
+
+    def observe(self, key, bounds, value):
+        self.buckets[key][bisect_left(bounds, value)] += 1
+        self.sums[key] += value
+
+
+# Number of lock-striped counter shards.
+SHARD_COUNT = 16
+
+_local = threading.local()
+_next_stripe = count()
+_shards = [(threading.Lock(), {}) for _ in range(SHARD_COUNT)]  # (lock, {route: RouteMetrics})
+_flush_lock = threading.Lock()
+_next_flush = 0.0
+
+
+def _shard():
+    """Return this thread's (lock, routes) shard, assigned round-robin on first use."""
+    try:
+        stripe = _local.stripe
+    except AttributeError:
+        stripe = _local.stripe = next(_next_stripe) % SHARD_COUNT
+    return _shards[stripe]
+
+
+def observe(route, status, seconds, queries, size=None):
+    """Record one request. `size` is None for streaming responses."""
+    lock, routes = _shard()
+    with lock:
+        metrics = routes.get(route)
+        if metrics is None:
+            metrics = routes[route] = RouteMetrics()
+        metrics.requests[status] = metrics.requests.get(status, 0) + 1
+        metrics.observe('latency', LATENCY_BUCKETS, seconds)
+        metrics.observe('queries', QUERY_BUCKETS, queries)
+        if size is not None:
+            metrics.observe('size', SIZE_BUCKETS, size)
+
+    options = metrics_settings()
+    if options['MULTIPROCESS_DIR'] and time.monotonic() >= _next_flush and _flush_lock.acquire(blocking=False):
+        try:
+            _flush(options)
+        finally:
+            _flush_lock.release()
+
+
+def snapshot():
+    """This process's totals as plain JSON-able data."""
+    routes = {}
+    for lock, shard in _shards:
+        with lock:
+            for route, metrics in shard.items():
+                total = routes.setdefault(route, _empty())
+                _add(total, {'requests': metrics.requests, 'buckets': metrics.buckets, 'sums': metrics.sums})
+    return {'routes': routes, 'cache': cache_stats()}
+
+
+def _empty():
+    return {
+        'requests': {},
+        'buckets': {key: [0] * (len(bounds) + 1) for key, _, _, bounds in HISTOGRAMS},
+        'sums': {key: 0 for key, _, _, _ in HISTOGRAMS},
+    }
+
+
+def _add(total, part):
+    """Add one route's totals (from a thread or a process) into `total`."""
+    for status, n in part['requests'].items():
+        total['requests'][str(status)] = total['requests'].get(str(status), 0) + n
+    for key, counts in part['buckets'].items():
+        total['buckets'][key] = [a + b for a, b in zip(total['buckets'][key], counts)]
+        total['sums'][key] += part['sums'][key]
+
+
+def _flush(options):
+    """Write this process's totals to MULTIPROCESS_DIR/<pid>.json, atomically."""
+    global _next_flush
+    _next_flush = time.monotonic() + options['FLUSH_INTERVAL']
+    directory = options['MULTIPROCESS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(f'{path}.tmp', path)
+
+
+def collect():
+    """Totals over every process sharing MULTIPROCESS_DIR, or this process alone."""
+    options = metrics_settings()
+    if not options['MULTIPROCESS_DIR']:
+        return snapshot()
+    with _flush_lock:
+        _flush(options)
+    merged = {'routes': {}, 'cache': {}}
+    for entry in os.scandir(options['MULTIPROCESS_DIR']):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path) as f:
+                part = json.load(f)
+        except (OSError, ValueError):
+            continue  # Being replaced or truncated; it is read again on the next scrape
+        for route, metrics in part['routes'].items():
+            total = merged['routes'].setdefault(route, _empty())
+            _add(total, metrics)
+        for view, counters in part['cache'].items():
+            total = merged['cache'].setdefault(view, {})
+            for outcome, n in counters.items():
+                total[outcome] = total.get(outcome, 0) + n
+    return merged
+
+
+def table_sizes():
+    """Row counts of METRICS['TABLES'], cached for TABLE_SIZES_TTL seconds."""
+    options = metrics_settings()
+
+    def count():
+        return {model._meta.db_table: model.objects.count()
+                for model in map(apps.get_model, options['TABLES'])}
+
+    return cache.get_or_set(TABLE_SIZES_CACHE_KEY, count, options['TABLE_SIZES_TTL'])
+
+
+def _labels(**labels):
+    escape = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def render_metrics():
+    """Return every series in the Prometheus text exposition format."""
+    data = collect()
+    routes = sorted(data['routes'].items())
+    lines = [
+        '# HELP cs412_http_requests_total Requests handled, by URL name and status code.',
+        '# TYPE cs412_http_requests_total counter',
+    ]
+    for route, metrics in routes:
+        for status, n in sorted(metrics['requests'].items()):
+            lines.append(f'cs412_http_requests_total{_labels(route=route, status=status)} {n}')
+
+    for key, name, help_text, bounds in HISTOGRAMS:
+        lines += [f'# HELP cs412_{name} {help_text}', f'# TYPE cs412_{name} histogram']
+        for route, metrics in routes:
+            cumulative = 0
+            for bound, n in zip((*bounds, '+Inf'), metrics['buckets'][key]):
+                cumulative += n
+                lines.append(f'cs412_{name}_bucket{_labels(route=route, le=bound)} {cumulative}')
+            lines.append(f'cs412_{name}_sum{_labels(route=route)} {metrics["sums"][key]}')
+            lines.append(f'cs412_{name}_count{_labels(route=route)} {cumulative}')
+
+    cached = sorted(data['cache'].items())
+    lines += [
+        '# HELP cs412_response_cache_requests_total Response cache lookups, by view and outcome.',
+        '# TYPE cs412_response_cache_requests_total counter',
+    ]
+    for view, counters in cached:
+        for outcome, n in sorted(counters.items()):
+            lines.append(f'cs412_response_cache_requests_total{_labels(view=view, outcome=outcome)} {n}')
+    lines += [
+        '# HELP cs412_response_cache_hit_ratio Hits / (hits + misses) of the response cache, by view.',
+        '# TYPE cs412_response_cache_hit_ratio gauge',
+    ]
+    for view, counters in cached:
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        if lookups:
+            lines.append(f'cs412_response_cache_hit_ratio{_labels(view=view)} {counters.get("hits", 0) / lookups:.4f}')
+
+    lines += ['# HELP cs412_table_rows Rows in the table.', '# TYPE cs412_table_rows gauge']
+    for table, rows in sorted(table_sizes().items()):
+        lines.append(f'cs412_table_rows{_labels(table=table)} {rows}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:25
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    """Populate the new rating columns from existing comments."""
+    Circuit = apps.get_model('circuits', 'Circuit')
+    Comment = apps.get_model('circuits', 'Comment')
+
+    totals = {}
+    rows = Comment.objects.values('circuit_id', 'rating').annotate(n=Count('id')).order_by()
+    for row in rows:
+        totals.setdefault(row['circuit_id'], {})[row['rating']] = row['n']
+
+    circuits = list(Circuit.objects.filter(pk__in=totals))
+    for circuit in circuits:
+        histogram = totals[circuit.pk]
+        circuit.rating_count = sum(histogram.values())
+        circuit.rating_sum = sum(star * n for star, n in histogram.items())
+        for star in range(1, 6):
+            setattr(circuit, f'rating_{star}_count', histogram.get(star, 0))
+
+    fields = ['rating_count', 'rating_sum'] + [f'rating_{star}_count' for star in range(1, 6)]
+    Circuit.objects.bulk_update(circuits, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0009_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='circuit',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circuit',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circuit',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circuit',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circuit',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circuit',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circuit',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
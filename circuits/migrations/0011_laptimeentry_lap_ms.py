@@ -0,0 +1,60 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:40
+
+import re
+
+from django.db import migrations, models
+
+
+LAP_TIME_PATTERN = re.compile(r'^(?:(\d+):)?(\d+)(?:\.(\d{1,3}))?$')
+
+# Legacy rows whose text cannot be parsed sort after every real lap time.
+UNPARSEABLE_LAP_MS = 2 ** 31 - 1
+
+
+def lap_time_to_ms(value):
+    """Lenient parse of a stored lap_time string into milliseconds."""
+    match = LAP_TIME_PATTERN.match((value or '').strip())
+    if not match:
+        return UNPARSEABLE_LAP_MS
+    minutes, seconds, fraction = match.groups()
+    millis = int((fraction or '0').ljust(3, '0'))
+    return (int(minutes or 0) * 60 + int(seconds)) * 1000 + millis
+
+
+def backfill_lap_ms(apps, schema_editor):
+    """Convert every existing lap_time string into lap_ms in bulk."""
+    LapTimeEntry = apps.get_model('circuits', 'LapTimeEntry')
+    batch = []
+    for entry in LapTimeEntry.objects.only('id', 'lap_time').iterator(chunk_size=2000):
+        entry.lap_ms = lap_time_to_ms(entry.lap_time)
+        batch.append(entry)
+        if len(batch) >= 2000:
+            LapTimeEntry.objects.bulk_update(batch, ['lap_ms'])
+            batch = []
+    if batch:
+        LapTimeEntry.objects.bulk_update(batch, ['lap_ms'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0010_circuit_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='laptimeentry',
+            name='lap_ms',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_lap_ms, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='laptimeentry',
+            options={'ordering': ['lap_ms']},
+        ),
+        migrations.AddIndex(
+            model_name='laptimeentry',
+            index=models.Index(fields=['circuit', 'lap_ms'], name='laptime_circuit_ms_idx'),
+        ),
+    ]
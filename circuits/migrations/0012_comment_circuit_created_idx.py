@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0011_laptimeentry_lap_ms'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['circuit', 'created_at'], name='comment_circuit_created_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:55
+
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    """Create the FTS5 index over Circuit text fields and fill it (SQLite only)."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Circuit = apps.get_model('circuits', 'Circuit')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS circuits_circuit_fts USING fts5("
+        "name, location, introduction, fun_fact, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    rows = Circuit.objects.values_list('pk', 'name', 'location', 'introduction', 'fun_fact')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO circuits_circuit_fts (rowid, name, location, introduction, fun_fact) '
+            'VALUES (%s, %s, %s, %s, %s)',
+            [[value or '' for value in row] for row in rows],
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS circuits_circuit_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0012_comment_circuit_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0013_circuit_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='answer',
+            name='selected_choice',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='circuits.choice'),
+        ),
+    ]
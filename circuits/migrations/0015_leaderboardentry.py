@@ -0,0 +1,57 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_leaderboard(apps, schema_editor):
+    """Fill the leaderboard with each user's best existing attempt."""
+    QuizAttempt = apps.get_model('circuits', 'QuizAttempt')
+    LeaderboardEntry = apps.get_model('circuits', 'LeaderboardEntry')
+    best = {}
+    for attempt in QuizAttempt.objects.order_by('id').iterator(chunk_size=2000):
+        duration_ms = max(0, int((attempt.end_time - attempt.start_time).total_seconds() * 1000))
+        current = best.get(attempt.user_id)
+        if current is None or (-attempt.score, duration_ms) < (-current[0].score, current[1]):
+            best[attempt.user_id] = (attempt, duration_ms)
+    LeaderboardEntry.objects.bulk_create(
+        [
+            LeaderboardEntry(
+                user_id=user_id, attempt=attempt, score=attempt.score,
+                duration_ms=duration_ms, achieved_at=attempt.end_time,
+            )
+            for user_id, (attempt, duration_ms) in best.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('circuits', '0014_answer_selected_choice_nullable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField()),
+                ('duration_ms', models.PositiveIntegerField()),
+                ('achieved_at', models.DateTimeField()),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='circuits.quizattempt')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-score', 'duration_ms', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['-score', 'duration_ms', 'id'], name='leaderboard_rank_idx'),
+        ),
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_duration_ms(apps, schema_editor):
+    """Store end_time - start_time in milliseconds on every existing attempt."""
+    QuizAttempt = apps.get_model('circuits', 'QuizAttempt')
+    LeaderboardEntry = apps.get_model('circuits', 'LeaderboardEntry')
+    batch = []
+    for attempt in QuizAttempt.objects.only('id', 'start_time', 'end_time').iterator(chunk_size=2000):
+        attempt.duration_ms = max(0, int((attempt.end_time - attempt.start_time).total_seconds() * 1000))
+        batch.append(attempt)
+        if len(batch) >= 2000:
+            QuizAttempt.objects.bulk_update(batch, ['duration_ms'])
+            batch = []
+    if batch:
+        QuizAttempt.objects.bulk_update(batch, ['duration_ms'])
+
+    # Keep leaderboard rows consistent with the stored durations.
+    entries = list(LeaderboardEntry.objects.select_related('attempt'))
+    for entry in entries:
+        entry.duration_ms = entry.attempt.duration_ms
+    LeaderboardEntry.objects.bulk_update(entries, ['duration_ms'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0015_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='duration_ms',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_duration_ms, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='start_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['-score', 'duration_ms'], name='quizattempt_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['user', '-score', 'duration_ms'], name='quizattempt_user_best_idx'),
+        ),
+    ]
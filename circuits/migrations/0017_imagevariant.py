@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0016_quizattempt_duration_ms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(db_index=True, max_length=255)),
+                ('source_width', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('size', models.PositiveIntegerField()),
+            ],
+            options={
+                'ordering': ['source', 'format', 'width'],
+                'unique_together': {('source', 'width', 'format')},
+            },
+        ),
+    ]
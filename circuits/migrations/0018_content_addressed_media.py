@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:44
+
+import circuits.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0017_imagevariant'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='circuit',
+            name='layout_image',
+            field=models.ImageField(storage=circuits.storage.media_storage, upload_to='circuits/layouts/'),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(default='user_avatars/default.png', storage=circuits.storage.media_storage, upload_to='user_avatars/'),
+        ),
+    ]
@@ -3,14 +3,18 @@
 # File Description: Defines the database models for the circuits application, 
 # including Circuit, Comment, Question, Choice, QuizAttempt, and Answer.
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Avg
+from datetime import timedelta
+from django.db.models import Count, F, Func, OuterRef, Subquery
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 import re
-from django.db.models.signals import post_save # Import signals
+from django.core.cache import cache
+from . import response_cache, search
+from .storage import media_storage
+from django.db.models.signals import post_save, post_delete # Import signals
 from django.dispatch import receiver # Import receiver decorator
 
 
@@ -38,6 +42,16 @@ F1_2024_CAR_CHOICES = [
     ('Haas VF-24', 'Haas VF-24'),
 ]
 
+# Star values a Comment rating may take, and the Circuit column that counts each one.
+RATING_VALUES = range(1, 6)
+RATING_HISTOGRAM_FIELDS = {star: f'rating_{star}_count' for star in RATING_VALUES}
+
+# Cache key holding the serialized Leaflet marker JSON and its ETag.
+MAP_MARKERS_CACHE_KEY = 'circuits:map_markers'
+
+# Cache key holding the ids of every quiz question that can be asked.
+QUESTION_POOL_CACHE_KEY = 'circuits:quiz:question_pool'
+
 
 class Circuit(models.Model):
     """Represents a Formula 1 circuit."""
@@ -46,7 +60,7 @@ class Circuit(models.Model):
     location = models.CharField(max_length=100)
     latitude = models.FloatField()
     longitude = models.FloatField()
-    layout_image = models.ImageField(upload_to='circuits/layouts/')
+    layout_image = models.ImageField(upload_to='circuits/layouts/', storage=media_storage)
     record_lap_info = models.CharField(
         max_length=200,
         verbose_name='Record Lap Info',
@@ -114,12 +128,99 @@ class Circuit(models.Model):
         help_text="Number of wins for the driver with the most wins."
     )
 
+    # --- Denormalized rating aggregates (maintained by the Comment signal receivers) ---
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    @property
+    def average_rating(self):
+        """Return the stored average comment rating, or None if unrated."""
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def rating_histogram(self):
+        """Return a {star: count} dict built from the stored per-star columns."""
+        return {star: getattr(self, field) for star, field in RATING_HISTOGRAM_FIELDS.items()}
+
     def calculate_average_rating(self):
         """Calculates the average rating from all comments for this circuit."""
-        # Use aggregate to calculate the average rating of related comments.
-        result = self.comments.aggregate(average=Avg('rating')) 
-        # The result is a dictionary {'average': avg_value} or {'average': None}
-        return result['average'] 
+        # Read the stored aggregate instead of running an AVG over comments.
+        return self.average_rating
+
+    @classmethod
+    def apply_rating_change(cls, circuit_id, added=None, removed=None):
+        """Adjust the stored rating aggregates of one circuit in a single UPDATE.
+
+        Args:
+            circuit_id (int): Primary key of the circuit to update.
+            added (int | None): Rating of a comment that was created (or the new
+                value of an edited rating).
+            removed (int | None): Rating of a comment that was deleted (or the
+                old value of an edited rating).
+        """
+        updates = {}
+        count_delta = 0
+        sum_delta = 0
+        if added is not None:
+            count_delta += 1
+            sum_delta += added
+            updates[RATING_HISTOGRAM_FIELDS[added]] = F(RATING_HISTOGRAM_FIELDS[added]) + 1
+        if removed is not None:
+            count_delta -= 1
+            sum_delta -= removed
+            field = RATING_HISTOGRAM_FIELDS[removed]
+            # An edit that keeps the same star cancels out on that column.
+            updates[field] = updates[field] - 1 if field in updates else F(field) - 1
+        if not updates:
+            return
+        if count_delta:
+            updates['rating_count'] = F('rating_count') + count_delta
+        if sum_delta:
+            updates['rating_sum'] = F('rating_sum') + sum_delta
+        cls.objects.filter(pk=circuit_id).update(**updates)
+
+    @classmethod
+    def rebuild_rating_aggregates(cls):
+        """Recompute every circuit's rating aggregates from the Comment table.
+
+        Runs one grouped query over comments and writes the results back with
+        bulk_update. Returns the number of circuits updated.
+        """
+        totals = {}
+        rows = (
+            Comment.objects.values('circuit_id', 'rating')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        for row in rows:
+            totals.setdefault(row['circuit_id'], {})[row['rating']] = row['n']
+
+        circuits = list(cls.objects.all())
+        for circuit in circuits:
+            histogram = totals.get(circuit.pk, {})
+            circuit.rating_count = sum(histogram.values())
+            circuit.rating_sum = sum(star * n for star, n in histogram.items())
+            for star, field in RATING_HISTOGRAM_FIELDS.items():
+                setattr(circuit, field, histogram.get(star, 0))
+
+        fields = ['rating_count', 'rating_sum', *RATING_HISTOGRAM_FIELDS.values()]
+        cls.objects.bulk_update(circuits, fields, batch_size=500)
+        return len(circuits)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the layout image name as loaded, so saves that keep it skip variant generation."""
+        instance = super().from_db(db, field_names, values)
+        layout_image = instance.__dict__.get('layout_image')  # Not read through the descriptor: it may be deferred
+        instance._loaded_layout_image = getattr(layout_image, 'name', layout_image)
+        return instance
 
     def __str__(self):
         """Return the circuit name for display purposes."""
@@ -143,18 +244,69 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     rating = models.IntegerField(
         'Rating',
-        choices=[(i, f'{i} Stars') for i in range(1, 6)],
+        choices=[(i, f'{i} Stars') for i in RATING_VALUES],
         default=5
     )
 
+    class Meta:
+        # Backs keyset pagination of a circuit's comments on (created_at, id).
+        indexes = [
+            models.Index(fields=['circuit', 'created_at'], name='comment_circuit_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored circuit and rating, so a save can move the circuit's rating aggregates."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = (instance.__dict__.get('circuit_id'), instance.__dict__.get('rating'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Write the comment and its rating aggregate change (count_comment_rating) together."""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         """Return a short summary of who commented on which circuit."""
         return f'{self.user.username} on {self.circuit.name}'
 
-def validate_lap_time_format(value):
-    pattern = re.compile(r'^(\d{1,2}:)?\d{2}\.\d{3}$')
-    if not pattern.match(value):
+LAP_TIME_PATTERN = re.compile(r'^(?:(\d{1,2}):)?(\d{2})\.(\d{3})$')
+
+
+def parse_lap_time(value):
+    """Convert a 'MM:SS.mmm' or 'SS.mmm' lap time string into milliseconds.
+
+    Raises:
+        ValidationError: If the value does not match the expected format.
+    """
+    match = LAP_TIME_PATTERN.match(value or '')
+    if not match:
         raise ValidationError('Invalid lap time format. Use MM:SS.mmm or SS.mmm')
+    minutes, seconds, millis = match.groups()
+    return (int(minutes or 0) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def validate_lap_time_format(value):
+    parse_lap_time(value)
+
+
+class LapTimeQuerySet(models.QuerySet):
+    """Lap time queries that are answered from the (circuit, lap_ms) index."""
+
+    def for_circuit(self, circuit):
+        """Entries for one circuit, fastest first."""
+        return self.filter(circuit=circuit).order_by('lap_ms', 'id')
+
+    def top(self, circuit, limit=10):
+        """The `limit` fastest entries on a circuit."""
+        return self.for_circuit(circuit)[:limit]
+
+    def faster_than(self, circuit, lap_time):
+        """Entries on a circuit quicker than `lap_time` (a string or milliseconds)."""
+        if isinstance(lap_time, str):
+            lap_time = parse_lap_time(lap_time)
+        return self.for_circuit(circuit).filter(lap_ms__lt=lap_time)
+
 
 class LapTimeEntry(models.Model):
     circuit = models.ForeignKey('Circuit', on_delete=models.CASCADE, related_name='lap_times')
@@ -166,13 +318,23 @@ class LapTimeEntry(models.Model):
         help_text="Enter lap time in MM:SS.mmm or SS.mmm format (e.g., 1:23.456 or 83.456)"
     )
     
-    # lap_time = models.DurationField(help_text="Enter lap time (e.g., 0:1:23.456)")
+    # Lap time in integer milliseconds, parsed from lap_time on save; used for sorting and ranking.
+    lap_ms = models.PositiveIntegerField(editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LapTimeQuerySet.as_manager()
+
     class Meta:
-        ordering = ['lap_time'] 
-        # ordering = ['lap_time'] 
+        ordering = ['lap_ms']
         unique_together = [['circuit', 'user', 'car']]
+        indexes = [
+            models.Index(fields=['circuit', 'lap_ms'], name='laptime_circuit_ms_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Keep lap_ms in sync with the lap_time string before writing."""
+        self.lap_ms = parse_lap_time(self.lap_time)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} - {self.circuit.name} - {self.car}: {self.lap_time}"
@@ -203,6 +365,12 @@ class Choice(models.Model):
         return self.text
 
 
+def format_duration_ms(duration_ms):
+    """Format a duration in milliseconds as 'MM:SS'."""
+    minutes, seconds = divmod(duration_ms // 1000, 60)
+    return f'{minutes:02d}:{seconds:02d}'
+
+
 class QuizAttempt(models.Model):
     """Represents a user's attempt at the quiz."""
 
@@ -211,36 +379,148 @@ class QuizAttempt(models.Model):
         on_delete=models.CASCADE,
         related_name='quiz_attempts'
     )
-    start_time = models.DateTimeField(auto_now_add=True)
+    # Signed by the server when the quiz page is served (quiz.start_token).
+    start_time = models.DateTimeField(default=timezone.now)
     end_time = models.DateTimeField()
     score = models.IntegerField()
+    # Time taken in milliseconds, written once when the attempt is graded.
+    duration_ms = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', 'duration_ms'], name='quizattempt_rank_idx'),
+            models.Index(fields=['user', '-score', 'duration_ms'], name='quizattempt_user_best_idx'),
+        ]
 
     def duration(self):
-        """Calculate the total time taken for this quiz attempt.
+        """Return the total time taken for this quiz attempt.
 
         Returns:
-            datetime.timedelta: The difference between end_time and start_time.
+            datetime.timedelta: The stored duration_ms as a timedelta.
         """
-        return self.end_time - self.start_time
+        return timedelta(milliseconds=self.duration_ms)
 
     def formatted_duration(self):
         """Return duration as a 'MM:SS' formatted string.
 
-        Calculates the total seconds from the duration timedelta and formats
-        it into minutes and seconds.
-
         Returns:
             str: The duration formatted as 'MM:SS'.
         """
-        total_seconds = int(self.duration().total_seconds())
-        minutes, seconds = divmod(total_seconds, 60)
-        return f'{minutes:02d}:{seconds:02d}'
+        return format_duration_ms(self.duration_ms)
 
     def __str__(self):
         """Return a summary of the attempt including user and score."""
         return f'{self.user.username} – Score: {self.score}'
 
 
+class LeaderboardEntry(models.Model):
+    """Holds each user's best quiz attempt: highest score, then fastest duration.
+
+    Maintained by record_attempt() when a quiz is graded and rebuilt from
+    scratch by rebuild(); the leaderboard pages read only this table.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='leaderboard_entry'
+    )
+    attempt = models.ForeignKey(QuizAttempt, on_delete=models.CASCADE, related_name='+')
+    score = models.IntegerField()
+    duration_ms = models.PositiveIntegerField()
+    achieved_at = models.DateTimeField()
+
+    # Ranking order: score (desc), then duration (asc), then id as a stable tie-break.
+    RANK_KEYS = ['-score', 'duration_ms', 'id']
+
+    class Meta:
+        ordering = ['-score', 'duration_ms', 'id']
+        indexes = [
+            models.Index(fields=['-score', 'duration_ms', 'id'], name='leaderboard_rank_idx'),
+        ]
+
+    def __str__(self):
+        """Return the user and their best score."""
+        return f'{self.user.username} – Best: {self.score}'
+
+    def formatted_duration(self):
+        """Return the best attempt's duration as 'MM:SS'."""
+        return format_duration_ms(self.duration_ms)
+
+    @classmethod
+    def record_attempt(cls, attempt):
+        """Make `attempt` the user's entry if it beats (or is) their first attempt.
+
+        Uses a conditional UPDATE, so only a strictly better attempt replaces
+        the stored one; creates the entry on a user's first attempt.
+        """
+        duration_ms = attempt.duration_ms
+        values = {
+            'attempt': attempt,
+            'score': attempt.score,
+            'duration_ms': duration_ms,
+            'achieved_at': attempt.end_time,
+        }
+        beaten = models.Q(score__lt=attempt.score) | models.Q(
+            score=attempt.score, duration_ms__gt=duration_ms
+        )
+        if cls.objects.filter(user_id=attempt.user_id).filter(beaten).update(**values):
+            return
+        cls.objects.get_or_create(user_id=attempt.user_id, defaults=values)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every user's best attempt from QuizAttempt.
+
+        Streams attempts ordered by user, score (desc) and duration, keeps the
+        first row per user, and bulk inserts the results. Returns the number
+        of entries written.
+        """
+        attempts = (
+            QuizAttempt.objects.order_by('user_id', '-score', 'duration_ms', 'id')
+            .iterator(chunk_size=2000)
+        )
+        entries = []
+        last_user_id = None
+        for attempt in attempts:
+            if attempt.user_id == last_user_id:
+                continue
+            last_user_id = attempt.user_id
+            entries.append(cls(
+                user_id=attempt.user_id,
+                attempt=attempt,
+                score=attempt.score,
+                duration_ms=attempt.duration_ms,
+                achieved_at=attempt.end_time,
+            ))
+        cls.objects.all().delete()
+        cls.objects.bulk_create(entries, batch_size=500)
+        return len(entries)
+
+    @classmethod
+    def rank_of(cls, user):
+        """Return the user's entry annotated with `rank` (1 = best), or None.
+
+        The rank is a correlated COUNT of entries ordered ahead of the user's
+        entry, so it is answered in one query over leaderboard_rank_idx.
+        """
+        ahead = (
+            cls.objects.filter(
+                models.Q(score__gt=OuterRef('score'))
+                | models.Q(score=OuterRef('score'), duration_ms__lt=OuterRef('duration_ms'))
+                | models.Q(score=OuterRef('score'), duration_ms=OuterRef('duration_ms'), id__lt=OuterRef('id'))
+            )
+            .order_by()
+            .annotate(n=Func(F('id'), function='COUNT'))
+            .values('n')
+        )
+        return (
+            cls.objects.filter(user=user)
+            .annotate(rank=Subquery(ahead, output_field=models.IntegerField()) + 1)
+            .first()
+        )
+
+
 class Answer(models.Model):
     """Represents a specific answer given by a user during a quiz attempt."""
 
@@ -250,7 +530,8 @@ class Answer(models.Model):
         related_name='answers'
     )
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
-    selected_choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    # Empty when the question was left unanswered or the submitted choice was invalid
+    selected_choice = models.ForeignKey(Choice, on_delete=models.CASCADE, null=True, blank=True)
     is_correct = models.BooleanField()
 
     def __str__(self):
@@ -259,15 +540,44 @@ class Answer(models.Model):
         # Limit question text for brevity in admin or string representations
         return f'{self.attempt.user.username}: {self.question.text[:30]}... {status}'
     
+DEFAULT_AVATAR = 'user_avatars/default.png'
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='circuits_profile')
     # MODIFIED: Upload avatars to 'media/user_avatars/'
-    avatar = models.ImageField(upload_to='user_avatars/', default='user_avatars/default.png')
+    avatar = models.ImageField(upload_to='user_avatars/', default=DEFAULT_AVATAR, storage=media_storage)
     # END MODIFIED
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the avatar name as loaded, so saves that keep it skip variant generation."""
+        instance = super().from_db(db, field_names, values)
+        avatar = instance.__dict__.get('avatar')  # Not read through the descriptor: it may be deferred
+        instance._loaded_avatar = getattr(avatar, 'name', avatar)
+        return instance
+
     def __str__(self):
         return f'{self.user.username} Profile'
 
+class ImageVariant(models.Model):
+    """A resized copy of an uploaded image, written by circuits.image_variants."""
+    source = models.CharField(max_length=255, db_index=True)  # storage name of the original file
+    source_width = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)  # storage name of this copy
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)  # 'JPEG', 'PNG' or 'WEBP'
+    size = models.PositiveIntegerField()  # bytes
+
+    class Meta:
+        unique_together = ('source', 'width', 'format')
+        ordering = ['source', 'format', 'width']
+
+    def __str__(self):
+        return self.name
+
+
 # Signal Receiver (no changes needed here)
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
@@ -275,3 +585,103 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
     instance.circuits_profile.save()
 
+
+@receiver([post_save, post_delete], sender=Circuit)
+def invalidate_map_markers(sender, **kwargs):
+    """Drop the cached map marker JSON whenever a Circuit row is saved or deleted."""
+    cache.delete(MAP_MARKERS_CACHE_KEY)
+
+
+@receiver(post_save, sender=Circuit)
+def index_circuit_for_search(sender, instance, **kwargs):
+    """Refresh the circuit's row in the full-text search index after a save."""
+    search.index_circuit(instance)
+
+
+@receiver(post_delete, sender=Circuit)
+def remove_circuit_from_search(sender, instance, **kwargs):
+    """Drop the circuit's row from the full-text search index after a delete."""
+    search.remove_circuit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Circuit)
+def invalidate_circuit_pages(sender, instance, **kwargs):
+    """Expire the cached list page and this circuit's detail page."""
+    response_cache.invalidate_circuit(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_rating(sender, instance, created, **kwargs):
+    """Keep the circuit's rating aggregates in step with a saved comment,
+    whichever path (view, admin, shell) saved it."""
+    current = (instance.circuit_id, instance.rating)
+    loaded = None if created else getattr(instance, '_loaded_rating', None)
+    if created or (loaded is not None and loaded != current):
+        if loaded is not None and loaded[0] != current[0]:
+            # Moved to another circuit: take the old rating off the old one.
+            Circuit.apply_rating_change(loaded[0], removed=loaded[1])
+            loaded = None
+        Circuit.apply_rating_change(current[0], added=current[1], removed=loaded and loaded[1])
+    instance._loaded_rating = current
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment_rating(sender, instance, **kwargs):
+    """Remove a deleted comment's rating from its circuit, including cascade deletes."""
+    circuit_id, rating = getattr(instance, '_loaded_rating', (instance.circuit_id, instance.rating))
+    Circuit.apply_rating_change(circuit_id, removed=rating)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_pages_for_comment(sender, instance, **kwargs):
+    """Comments change the detail page and the list page's average rating."""
+    response_cache.invalidate_circuit(instance.circuit_id)
+
+
+@receiver([post_save, post_delete], sender=LapTimeEntry)
+def invalidate_pages_for_lap_time(sender, instance, **kwargs):
+    """Lap times only appear on the circuit's own detail page."""
+    response_cache.invalidate_circuit(instance.circuit_id, include_list=False)
+
+
+@receiver(post_save, sender=Circuit)
+def generate_layout_variants(sender, instance, update_fields=None, **kwargs):
+    """Queue the resized copies of a newly uploaded layout image, once it is committed.
+
+    Circuits are also saved by imports, rating rebuilds and admin edits, so
+    this only acts when the layout image itself changed.
+    """
+    if (update_fields is not None and 'layout_image' not in update_fields) \
+            or 'layout_image' in instance.get_deferred_fields():
+        return
+    layout_image = instance.layout_image
+    if not layout_image or layout_image.name == getattr(instance, '_loaded_layout_image', None):
+        return
+    from .image_variants import generate_variants_async
+    transaction.on_commit(lambda: generate_variants_async([layout_image]))
+    instance._loaded_layout_image = layout_image.name
+
+
+@receiver(post_save, sender=Profile)
+def generate_avatar_variants(sender, instance, update_fields=None, **kwargs):
+    """Queue the resized copies of a newly uploaded avatar, once it is committed.
+
+    Profiles are saved on every User save (including each login), so this
+    only acts when the avatar itself changed and is not the shared default.
+    """
+    if (update_fields is not None and 'avatar' not in update_fields) or 'avatar' in instance.get_deferred_fields():
+        return
+    name = instance.avatar.name
+    if name in (DEFAULT_AVATAR, getattr(instance, '_loaded_avatar', None)):
+        return
+    from .image_variants import generate_variants_async
+    avatar = instance.avatar
+    transaction.on_commit(lambda: generate_variants_async([avatar]))
+    instance._loaded_avatar = name
+
+
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=Choice)
+def invalidate_question_pool(sender, **kwargs):
+    """Drop the cached quiz question id pool when questions or choices change."""
+    cache.delete(QUESTION_POOL_CACHE_KEY)
@@ -0,0 +1,94 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Keyset (cursor) pagination helpers used by the circuit
+# detail page to page through comments and lap times without OFFSET scans.
+
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded for the given ordering."""
+
+
+def encode_cursor(values):
+    """Encode a list of ordering-key values into an opaque, URL-safe token."""
+    # Keep full microsecond precision so equality on the key stays exact.
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model, keys):
+    """Decode a token from encode_cursor back into typed values for `keys`.
+
+    Args:
+        token (str): The cursor token taken from the query string.
+        model (Model): Model whose fields the keys refer to.
+        keys (list[str]): Ordering keys, e.g. ['-created_at', '-id'].
+
+    Raises:
+        InvalidCursor: If the token is malformed or does not match the keys.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Malformed cursor.') from e
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor('Cursor does not match this ordering.')
+    try:
+        return [
+            model._meta.get_field(key.lstrip('-')).to_python(value)
+            for key, value in zip(keys, values)
+        ]
+    except (ValidationError, TypeError, ValueError) as e:
+        # e.g. a list or object where a datetime string belongs
+        raise InvalidCursor('Cursor value has the wrong type.') from e
+
+
+def _after(keys, values):
+    """Build the Q filter selecting rows that come strictly after `values`.
+
+    For keys (a, b) this is: a > x OR (a = x AND b > y), with the comparison
+    flipped to < for descending keys. A redundant a >= x bound is ANDed on so
+    the database can seek straight to the cursor in an index on (a, b).
+    """
+    first = keys[0]
+    bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+    condition = Q()
+    for i, key in enumerate(keys):
+        name = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        term = Q(**{f'{name}__{lookup}': values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            term &= Q(**{prev_key.lstrip('-'): prev_value})
+        condition |= term
+    return bound & condition
+
+
+def keyset_page(queryset, keys, cursor=None, page_size=20):
+    """Return one page of `queryset` ordered by `keys`, starting after `cursor`.
+
+    Fetches page_size + 1 rows in a single query to learn whether another
+    page exists, so each page costs one indexed query regardless of depth.
+
+    Returns:
+        tuple: (list of objects, next cursor token or None)
+    """
+    queryset = queryset.order_by(*keys)
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, keys)
+        queryset = queryset.filter(_after(keys, values))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, key.lstrip('-')) for key in keys])
+    return rows, next_cursor
@@ -0,0 +1,237 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Request profiling. ProfilingMiddleware times every
+# request (SQL count and time, template rendering, view, total), sends the
+# numbers to the browser as a Server-Timing header, and keeps rolling
+# aggregates per URL name in memory, along with the SQL query shapes that
+# are repeated within a single request (the usual sign of an N+1 loop).
+# The staff-only circuits:profiling_stats view returns them as JSON, and
+# every request is also counted in the Prometheus metrics (metrics.py).
+# With settings.REQUEST_PROFILING off only the metrics are collected, and
+# Template.render is left alone.
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+from django.utils.functional import empty
+
+from . import metrics
+
+# Recent requests kept per URL name for the latency percentiles.
+PROFILING_WINDOW = 500
+# Distinct repeated query shapes kept; the least repeated are dropped beyond this.
+MAX_QUERY_SHAPES = 500
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                                # string literals
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),                             # numbers
+    (re.compile(r'\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)'), '(...)'),  # IN lists of any length
+]
+
+
+def query_shape(sql):
+    """Reduce a SQL statement to its shape: literals and IN lists replaced by placeholders."""
+    for pattern, placeholder in _LITERALS:
+        sql = pattern.sub(placeholder, sql)
+    return sql
+
+
+class RequestTimings:
+    """Timings collected while one request is handled."""
+
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+        self.template = 0.0
+        self.template_depth = 0
+
+    @property
+    def db(self):
+        return sum(duration for _, duration in self.queries)
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook: time one statement."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+
+_current = ContextVar('request_timings', default=None)
+_original_render = Template.render
+_install_lock = threading.Lock()
+
+
+def _timed_render(self, context):
+    """Template.render that adds the outermost render's time to the current request.
+
+    Included and extended templates render inside their parent, so only the
+    outermost call is counted.
+    """
+    timings = _current.get()
+    if timings is None:
+        return _original_render(self, context)
+    timings.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        timings.template_depth -= 1
+        if timings.template_depth == 0:
+            timings.template += time.perf_counter() - started
+
+
+def install_template_timing():
+    """Patch Template.render to time templates; safe to call more than once."""
+    with _install_lock:
+        if Template.render is not _timed_render:
+            Template.render = _timed_render
+
+
+class RouteStats:
+    """Rolling aggregates for one URL name."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = self.db = self.template = self.view = 0.0
+        self.queries = 0
+        self.max = 0.0
+        self.recent = deque(maxlen=PROFILING_WINDOW)
+
+    def add(self, total, view, template, db, queries):
+        self.count += 1
+        self.total += total
+        self.view += view
+        self.template += template
+        self.db += db
+        self.queries += queries
+        self.max = max(self.max, total)
+        self.recent.append(total)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        pick = lambda pct: round(recent[min(len(recent) - 1, int(pct / 100 * len(recent)))] * 1000, 2)
+        return {
+            'requests': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 2),
+            'p50_ms': pick(50),
+            'p95_ms': pick(95),
+            'max_ms': round(self.max * 1000, 2),
+            'view_ms': round(self.view / self.count * 1000, 2),
+            'template_ms': round(self.template / self.count * 1000, 2),
+            'db_ms': round(self.db / self.count * 1000, 2),
+            'queries': round(self.queries / self.count, 2),
+        }
+
+
+_lock = threading.Lock()
+_routes = {}
+_repeated = Counter()       # query shape -> extra executions (beyond the first) summed over requests
+_repeated_routes = {}       # query shape -> URL name it was last repeated on
+
+
+def record(route, total, view, template, queries):
+    """Add one request to the per-route aggregates."""
+    shapes = Counter(query_shape(sql) for sql, _ in queries)
+    repeated = {shape: n - 1 for shape, n in shapes.items() if n > 1}
+    with _lock:
+        _routes.setdefault(route, RouteStats()).add(
+            total, view, template, sum(d for _, d in queries), len(queries),
+        )
+        if repeated:
+            _repeated.update(repeated)
+            for shape in repeated:
+                _repeated_routes[shape] = route
+            if len(_repeated) > MAX_QUERY_SHAPES * 2:
+                for shape, _ in _repeated.most_common()[MAX_QUERY_SHAPES:]:
+                    del _repeated[shape]
+                    _repeated_routes.pop(shape, None)
+
+
+def profiling_stats(limit=20):
+    """Return the slowest routes (by p95) and the most repeated query shapes."""
+    with _lock:
+        routes = {route: stats.summary() for route, stats in _routes.items()}
+        repeated = [
+            {'query': shape, 'extra_executions': n, 'route': _repeated_routes.get(shape)}
+            for shape, n in _repeated.most_common(limit)
+        ]
+    slowest = sorted(routes.items(), key=lambda item: item[1]['p95_ms'], reverse=True)[:limit]
+    return {
+        'slowest_routes': [{'route': route, **summary} for route, summary in slowest],
+        'repeated_queries': repeated,
+    }
+
+
+def reset_profiling_stats():
+    with _lock:
+        _routes.clear()
+        _repeated.clear()
+        _repeated_routes.clear()
+
+
+class ProfilingMiddleware:
+    """Times each request and reports it in a Server-Timing header and profiling_stats().
+
+    The header is sent when DEBUG is on or the user is staff; the user is
+    only checked if the request already loaded it, so the middleware never
+    runs the session and user queries itself. `view` is the
+    time spent from URL resolution to the response, minus template rendering;
+    `db` overlaps with both. With REQUEST_PROFILING off it only feeds metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'REQUEST_PROFILING', True)
+        if self.enabled:
+            install_template_timing()
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings) if self.enabled else None
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            if token is not None:
+                _current.reset(token)
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else '<unresolved>'
+        metrics.observe(
+            route, response.status_code, total, len(timings.queries),
+            None if response.streaming else len(response.content),
+        )
+        if not self.enabled:
+            return response
+
+        view_started = getattr(request, '_profiling_view_started', started)
+        view = max(0.0, started + total - view_started - timings.template)
+        record(route, total, view, timings.template, timings.queries)
+
+        user = getattr(request, 'user', None)
+        if getattr(user, '_wrapped', None) is empty:
+            user = None  # Never loaded: reading is_staff now would query outside the timings
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timings.db * 1000:.2f};desc="{len(timings.queries)} queries"',
+                f'tpl;dur={timings.template * 1000:.2f}',
+                f'view;dur={view * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}',
+            ])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.enabled:
+            request._profiling_view_started = time.perf_counter()
@@ -0,0 +1,163 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Quiz engine for the 'circuits' application. Samples a
+# quiz deck and grades a submitted quiz, each with a fixed number of queries
+# regardless of how many questions the bank contains.
+
+import random
+from datetime import datetime
+
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Answer, Choice, LeaderboardEntry, Question, QuizAttempt, QUESTION_POOL_CACHE_KEY,
+)
+
+# Number of questions presented in one quiz.
+QUIZ_LENGTH = 6
+# How long a quiz page stays valid for submission (seconds).
+QUIZ_MAX_AGE = 60 * 60
+_start_signer = signing.TimestampSigner(salt='circuits.quiz.start')
+
+
+class QuizSubmissionError(Exception):
+    """Raised when a submitted quiz cannot be graded (unknown or malformed questions)."""
+
+
+def question_pool():
+    """Return the ids of all questions that have at least one choice.
+
+    The list is cached until a Question or Choice changes (see
+    circuits.models.invalidate_question_pool).
+    """
+    pool = cache.get(QUESTION_POOL_CACHE_KEY)
+    if pool is None:
+        pool = list(
+            Choice.objects.order_by('question_id').values_list('question_id', flat=True).distinct()
+        )
+        cache.set(QUESTION_POOL_CACHE_KEY, pool, None)
+    return pool
+
+
+def sample_questions(count=QUIZ_LENGTH):
+    """Pick up to `count` random questions, with their choices prefetched.
+
+    Sampling happens over the cached id pool, so only the chosen questions
+    are read: one query for the questions and one for their choices.
+    """
+    pool = question_pool()
+    sampled_ids = random.sample(pool, min(len(pool), count))
+    if not sampled_ids:
+        return []
+    questions = {
+        question.id: question
+        for question in Question.objects.filter(id__in=sampled_ids).prefetch_related('choices')
+    }
+    # Keep the random order; skip ids deleted since the pool was cached.
+    return [questions[qid] for qid in sampled_ids if qid in questions]
+
+
+def start_token(user):
+    """Return a signed token recording when `user` was served the quiz page.
+
+    The start time is set here, on the server, and cannot be altered by the
+    client; it is what the quiz duration (and so the leaderboard) is ranked on.
+    """
+    return _start_signer.sign(f'{user.pk}/{timezone.now().isoformat()}')
+
+
+def parse_start_token(token, user):
+    """Return the start time held in a start_token() for `user`.
+
+    Raises:
+        QuizSubmissionError: If the token is missing, forged, issued to
+            another user, older than QUIZ_MAX_AGE or in the future.
+    """
+    try:
+        user_pk, started = _start_signer.unsign(token or '', max_age=QUIZ_MAX_AGE).split('/', 1)
+        start_time = datetime.fromisoformat(started)
+    except (signing.BadSignature, ValueError) as e:
+        raise QuizSubmissionError('Invalid quiz start time.') from e
+    if user_pk != str(user.pk) or timezone.is_naive(start_time) or start_time > timezone.now():
+        raise QuizSubmissionError('Invalid quiz start time.')
+    return start_time
+
+
+def _parse_ids(values):
+    """Convert submitted id strings to ints, raising QuizSubmissionError on junk."""
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError) as e:
+        raise QuizSubmissionError('Malformed question id.') from e
+
+
+def grade_quiz(user, start_time, end_time, question_ids, submitted):
+    """Grade one quiz submission and record it.
+
+    Every submitted choice is resolved in a single query and checked against
+    its question in memory. The attempt is written once with its final score,
+    all Answer rows go in with one bulk_create, and the user's leaderboard
+    entry is updated, inside one transaction.
+
+    Args:
+        user (User): The user taking the quiz.
+        start_time (datetime): When the quiz was started.
+        end_time (datetime): When the quiz was submitted.
+        question_ids (list[str]): Ids of the questions that were presented.
+        submitted (Mapping): Form data holding 'question_<id>' -> choice id.
+
+    Returns:
+        tuple: (QuizAttempt, list of warning strings for invalid choices)
+
+    Raises:
+        QuizSubmissionError: If any presented question id is malformed or unknown.
+    """
+    ids = list(dict.fromkeys(_parse_ids(question_ids)))  # de-duplicate, keep order
+    questions = dict(Question.objects.filter(id__in=ids).values_list('id', 'text'))
+    if len(questions) != len(ids):
+        raise QuizSubmissionError('Unknown question submitted.')
+
+    selected = {}
+    for qid in ids:
+        raw = submitted.get(f'question_{qid}')
+        if raw:
+            try:
+                selected[qid] = int(raw)
+            except ValueError:
+                selected[qid] = None  # Answered, but not with a usable choice id
+
+    choice_ids = [cid for cid in selected.values() if cid is not None]
+    choices = Choice.objects.only('id', 'question_id', 'is_correct').in_bulk(choice_ids)
+
+    score = 0
+    answers = []
+    warnings = []
+    for qid in ids:
+        choice = choices.get(selected.get(qid))
+        if qid in selected and choice is None:
+            warnings.append(f"Invalid choice submitted for question '{questions[qid]}'.")
+        elif choice is not None and choice.question_id != qid:
+            # Submitted choice_id belongs to a different question
+            warnings.append(f"Submitted choice for question '{questions[qid]}' was invalid.")
+            choice = None
+        is_correct = choice is not None and choice.is_correct
+        score += is_correct
+        answers.append(Answer(question_id=qid, selected_choice=choice, is_correct=is_correct))
+
+    # Stored once here so the database can rank and sort by quiz speed.
+    duration_ms = max(0, int((end_time - start_time).total_seconds() * 1000))
+
+    with transaction.atomic():
+        attempt = QuizAttempt.objects.create(
+            user=user, start_time=start_time, end_time=end_time, score=score,
+            duration_ms=duration_ms,
+        )
+        for answer in answers:
+            answer.attempt = attempt
+        Answer.objects.bulk_create(answers)
+        LeaderboardEntry.record_attempt(attempt)
+
+    return attempt, warnings
@@ -0,0 +1,156 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Response cache for the public circuits pages (the circuit
+# list and circuit detail views). Entries are keyed on the URL and the query
+# parameters the view actually reads, and are invalidated per circuit by the
+# post_save / post_delete receivers in models.py.
+#
+# Invalidation works by bumping generation counters that are part of every
+# cache key, so it needs only get/add/incr and works with any Django cache
+# backend, including the local-memory and file-based ones (which cannot
+# delete keys by pattern). Bumps wait for the writer's transaction to
+# commit, so a concurrent request cannot re-cache the old page under the new
+# generation.
+
+import hashlib
+import threading
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+
+# How long a cached page may live even if nothing invalidates it (seconds).
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+
+LIST_GENERATION_KEY = 'circuits:rc:gen:list'
+CIRCUIT_GENERATION_KEY = 'circuits:rc:gen:circuit:{}'
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _record(view_name, outcome):
+    """Count a 'hits' / 'misses' / 'bypass' outcome for one cached view."""
+    with _stats_lock:
+        counters = _stats.setdefault(view_name, {'hits': 0, 'misses': 0, 'bypass': 0})
+        counters[outcome] += 1
+
+
+def cache_stats():
+    """Return a snapshot of per-view hit/miss/bypass counters for this process."""
+    with _stats_lock:
+        return {name: dict(counters) for name, counters in _stats.items()}
+
+
+def reset_cache_stats():
+    """Clear the per-process hit/miss counters."""
+    with _stats_lock:
+        _stats.clear()
+
+
+def _generations(keys):
+    """Return the current generation number for each key, creating missing ones."""
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, 1, None)
+            found[key] = cache.get(key, 1)
+    return [found[key] for key in keys]
+
+
+def _bump(key):
+    """Advance one generation counter, orphaning every entry built on the old value."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter was never created (or was evicted); any value differs from
+        # the implicit 1 that readers will recreate, so start above it.
+        cache.set(key, 2, None)
+
+
+def invalidate_circuit(circuit_id, include_list=True):
+    """Invalidate the cached detail page of one circuit (and the list page) once
+    the current transaction commits."""
+    key = CIRCUIT_GENERATION_KEY.format(circuit_id)
+    transaction.on_commit(lambda: _bump(key))
+    if include_list:
+        invalidate_list()
+
+
+def invalidate_list():
+    """Invalidate every cached circuit list page (e.g. after a bulk import) once
+    the current transaction commits."""
+    transaction.on_commit(lambda: _bump(LIST_GENERATION_KEY))
+
+
+def _has_pending_messages(request):
+    """Return True if the request has flash messages that the page would show."""
+    storage = get_messages(request)
+    pending = bool(list(storage))
+    if pending:
+        storage.used = False  # Iterating marks them consumed; keep them for the template.
+    return pending
+
+
+def cache_circuit_page(view_name, query_params=(), circuit_kwarg=None):
+    """Decorator that caches anonymous GET responses of a circuits page.
+
+    Args:
+        view_name (str): Name used in the cache key and the hit/miss counters.
+        query_params (tuple[str]): GET parameters that change the page's content.
+        circuit_kwarg (str | None): URL kwarg holding the circuit pk for a
+            per-circuit page. If None the page depends on the list generation.
+
+    Authenticated requests always bypass the cache, since those pages carry
+    per-user content (forms, edit buttons, CSRF tokens). Responses are marked
+    Vary: Cookie so downstream caches keep the two states apart.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+                or _has_pending_messages(request)
+            ):
+                _record(view_name, 'bypass')
+                response = view_func(request, *args, **kwargs)
+                patch_vary_headers(response, ('Cookie',))
+                return response
+
+            if circuit_kwarg is None:
+                generation_key = LIST_GENERATION_KEY
+            else:
+                generation_key = CIRCUIT_GENERATION_KEY.format(kwargs[circuit_kwarg])
+            generation, = _generations([generation_key])
+
+            query = urlencode([(name, request.GET.get(name, '')) for name in query_params])
+            digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+            cache_key = f'circuits:rc:{view_name}:anon:{generation}:{digest}'
+
+            cached = cache.get(cache_key)
+            if cached is not None:
+                _record(view_name, 'hits')
+                cached['X-Cache'] = 'HIT'
+                return cached
+
+            _record(view_name, 'misses')
+            response = view_func(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+
+            def store(rendered):
+                # Never share a response that sets cookies or is not a plain 200.
+                if rendered.status_code == 200 and not rendered.cookies:
+                    cache.set(cache_key, rendered, RESPONSE_CACHE_TIMEOUT)
+                rendered['X-Cache'] = 'MISS'
+
+            if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,226 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Opt-in sampling profiler for live traffic. cs412/wsgi.py
+# and cs412/asgi.py wrap the Django application with wrap_wsgi() / wrap_asgi();
+# when settings.SAMPLING_PROFILER['ENABLED'] is off they return the
+# application unchanged, so there is no overhead at all. When on, a fraction
+# of requests (RATE, optionally only for URL_NAMES) or any request carrying
+# the X-Profile-Request header with the configured token is profiled, and the
+# result is written under DIR/<url name>/ as a collapsed-stack file (MODE
+# 'stack', a statistical sampler) or a pstats file (MODE 'cprofile'). The
+# directory is rotated to MAX_FILES files; `manage.py merge_profiles` merges
+# them into one flamegraph-ready file per route.
+
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import count
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+DEFAULTS = {
+    'ENABLED': False,
+    'RATE': 0.01,           # Fraction of (eligible) requests profiled
+    'URL_NAMES': [],        # If set, only these URL names are sampled at RATE
+    'HEADER_TOKEN': None,   # X-Profile-Request: <token> profiles that request
+    'MODE': 'stack',        # 'stack' (collapsed stacks) or 'cprofile' (pstats)
+    'INTERVAL': 0.005,      # Seconds between stack samples
+    'DIR': 'profiles',
+    'MAX_FILES': 500,
+}
+HEADER = 'HTTP_X_PROFILE_REQUEST'
+MERGED_DIR = 'merged'
+
+_sequence = count()
+
+
+def profiler_settings():
+    return {**DEFAULTS, **getattr(settings, 'SAMPLING_PROFILER', {})}
+
+
+def route_name(path):
+    """URL name of a path ('circuits:circuit_detail'), used as the profile's directory."""
+    try:
+        return resolve(path).view_name or 'unnamed'
+    except Resolver404:
+        return 'unresolved'
+
+
+class StackSampler:
+    """Samples the Python stacks of registered threads every `interval` seconds.
+
+    One daemon thread serves all profiled requests and sleeps while none is
+    active. Each sample of a thread adds one to the count of its stack,
+    written root first as 'module:function;module:function;...'.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+        self.thread = None
+
+    def start(self, thread_ids=None):
+        """Begin sampling `thread_ids` (None: every thread). Returns the session's Counter."""
+        stacks = Counter()
+        with self.lock:
+            self.sessions[id(stacks)] = (thread_ids, stacks)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self.thread.start()
+        self.active.set()
+        return stacks
+
+    def stop(self, stacks):
+        with self.lock:
+            self.sessions.pop(id(stacks), None)
+            if not self.sessions:
+                self.active.clear()
+        return stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self.active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_ids, stacks in self.sessions.values():
+                    for ident, frame in frames.items():
+                        if ident != own and (thread_ids is None or ident in thread_ids):
+                            stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            module = frame.f_globals.get('__name__', '?')
+            names.append(f"{module}:{getattr(code, 'co_qualname', code.co_name)}".replace(';', ','))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """Decides which requests to profile and writes their profiles to disk."""
+
+    def __init__(self, options):
+        self.rate = options['RATE']
+        self.url_names = set(options['URL_NAMES'])
+        self.token = options['HEADER_TOKEN']
+        self.mode = options['MODE']
+        self.dir = options['DIR']
+        self.max_files = options['MAX_FILES']
+        self.sampler = StackSampler(options['INTERVAL'])
+
+    def should_profile(self, environ_get, path):
+        """Cheap for unsampled requests: one header lookup and one random number."""
+        # Constant-time, on raw bytes: WSGI and ASGI header values arrive latin-1 decoded
+        if self.token and hmac.compare_digest(
+            (environ_get(HEADER) or '').encode('latin1', 'replace'), self.token.encode()
+        ):
+            return True
+        if random.random() >= self.rate:
+            return False
+        return not self.url_names or route_name(path) in self.url_names
+
+    def profile(self, func, path, thread_ids):
+        """Run func() under the profiler and save the result for path's route."""
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func)
+            finally:
+                self._save(path, '.pstats', profiler.dump_stats)
+        stacks = self.sampler.start(thread_ids)
+        try:
+            return func()
+        finally:
+            self.save_stacks(path, self.sampler.stop(stacks))
+
+    def save_stacks(self, path, stacks):
+        """Write stacks in the collapsed format: one 'frame;frame;... count' line per stack."""
+        if not stacks:
+            return  # Finished before the first sample
+
+        def write(name):
+            with open(name, 'w') as f:
+                for stack, n in stacks.items():
+                    f.write(f'{stack} {n}\n')
+
+        self._save(path, '.collapsed', write)
+
+    def _save(self, path, suffix, write):
+        route_dir = os.path.join(self.dir, route_name(path).replace(':', '.'))
+        os.makedirs(route_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        write(os.path.join(route_dir, f'{stamp}-{os.getpid()}-{next(_sequence)}{suffix}'))
+        self._rotate()
+
+    def _rotate(self):
+        """Delete the oldest profiles beyond max_files (merged output is kept)."""
+        files = []
+        for entry in os.scandir(self.dir):
+            if entry.is_dir() and entry.name != MERGED_DIR:
+                files += [f for f in os.scandir(entry.path) if f.is_file()]
+        if len(files) > self.max_files:
+            files.sort(key=lambda f: f.stat().st_mtime)
+            for f in files[:len(files) - self.max_files]:
+                try:
+                    os.remove(f.path)
+                except OSError:
+                    pass  # Another process rotated it first
+
+
+def wrap_wsgi(application):
+    """Return `application` wrapped by the sampling profiler, or unchanged if it is disabled."""
+    options = profiler_settings()
+    if not options['ENABLED']:
+        return application
+    profiler = SamplingProfiler(options)
+
+    def profiled_application(environ, start_response):
+        path = environ.get('PATH_INFO', '/')
+        if not profiler.should_profile(environ.get, path):
+            return application(environ, start_response)
+        return profiler.profile(
+            lambda: application(environ, start_response), path, {threading.get_ident()},
+        )
+
+    return profiled_application
+
+
+def wrap_asgi(application):
+    """ASGI counterpart of wrap_wsgi().
+
+    Django runs synchronous views in worker threads, so profiled ASGI requests
+    always use stack sampling over every thread; stacks of requests running
+    at the same time are mixed into the sample.
+    """
+    options = profiler_settings()
+    if not options['ENABLED']:
+        return application
+    profiler = SamplingProfiler({**options, 'MODE': 'stack'})
+
+    async def profiled_application(scope, receive, send):
+        if scope['type'] != 'http':
+            return await application(scope, receive, send)
+        headers = {f"HTTP_{k.decode('latin1').upper().replace('-', '_')}": v.decode('latin1')
+                   for k, v in scope.get('headers', [])}
+        path = scope.get('path', '/')
+        if not profiler.should_profile(headers.get, path):
+            return await application(scope, receive, send)
+        stacks = profiler.sampler.start(None)
+        try:
+            return await application(scope, receive, send)
+        finally:
+            profiler.save_stacks(path, profiler.sampler.stop(stacks))
+
+    return profiled_application
@@ -0,0 +1,104 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Full-text search over circuits backed by an SQLite FTS5
+# virtual table (circuits_circuit_fts). The table's rowid is the Circuit id;
+# it is kept in sync by signal receivers in models.py and can be rebuilt with
+# the rebuild_circuit_search management command.
+
+import re
+
+from django.db import connection
+
+FTS_TABLE = 'circuits_circuit_fts'
+
+# Indexed Circuit fields, in FTS column order, with their bm25 weights.
+FTS_COLUMNS = ('name', 'location', 'introduction', 'fun_fact')
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available():
+    """Return True if the default database can serve FTS5 queries."""
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Turn free user input into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term ("mon"*), and terms are ANDed, so
+    user input can never inject FTS5 query syntax. Returns '' if there are no
+    searchable words.
+    """
+    tokens = TOKEN_PATTERN.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def index_circuit(circuit):
+    """Insert or refresh one circuit's row in the FTS index."""
+    if not fts_available():
+        return
+    values = [getattr(circuit, field) or '' for field in FTS_COLUMNS]
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [circuit.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+            [circuit.pk, *values],
+        )
+
+
+def remove_circuit(circuit_id):
+    """Remove one circuit from the FTS index."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [circuit_id])
+
+
+def rebuild_index(circuits):
+    """Replace the whole FTS index with `circuits` in one bulk insert.
+
+    Args:
+        circuits (iterable): Circuit instances or dicts exposing 'pk' and FTS_COLUMNS.
+
+    Returns:
+        int: Number of rows indexed.
+    """
+    rows = []
+    for circuit in circuits:
+        get = circuit.get if isinstance(circuit, dict) else lambda f, c=circuit: getattr(c, f)
+        rows.append([get('pk'), *[get(field) or '' for field in FTS_COLUMNS]])
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+            rows,
+        )
+        # Merge the b-tree segments written by the bulk insert.
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return len(rows)
+
+
+def search_circuit_ids(text, limit=None):
+    """Return circuit ids matching `text`, best bm25 rank first.
+
+    Returns None if FTS5 is unavailable so callers can fall back to LIKE
+    filtering, and [] if the input contains no searchable words.
+    """
+    if not fts_available():
+        return None
+    match = build_match_query(text)
+    if not match:
+        return []
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    sql = (
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+        f'ORDER BY bm25({FTS_TABLE}, {weights})'
+    )
+    params = [match]
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
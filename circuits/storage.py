@@ -0,0 +1,86 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Content-addressed storage for uploaded media. Each file is
+# hashed (SHA-256) while it streams to disk and stored once, under a sharded
+# name 'ab/cd/<sha256>.<ext>' inside MEDIA_ROOT; uploading the same bytes again
+# reuses the existing file. Used by the ImageFields of both apps through
+# media_storage(); the rehome_media command moves older flat uploads into it.
+
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+# Matches names written by ContentAddressedStorage. The extension allows every
+# character get_valid_name() keeps, e.g. '.tar-gz' or '.JPG'.
+HASHED_NAME_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[\w-]+)?$', re.IGNORECASE)
+
+
+def hashed_name(hexdigest, ext=''):
+    """Sharded storage name for a SHA-256 hex digest, e.g. 'ab/cd/abcd...ef.jpg'."""
+    return f'{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{ext.lower()}'
+
+
+def is_hashed_name(name):
+    """Return True if `name` is a content-addressed storage name."""
+    return bool(HASHED_NAME_PATTERN.match(name or ''))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that names files by the SHA-256 of their content.
+
+    The requested name only contributes its extension. Because a stored file
+    may be shared by many rows, delete() leaves content-addressed files in
+    place; unreferenced ones are removed by `manage.py rehome_media --prune`.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save(), and an
+        # existing file with that name already holds the same bytes.
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        os.makedirs(self.location, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            name = hashed_name(digest.hexdigest(), ext)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(tmp_path)  # Same content is already stored
+                os.utime(full_path)  # Fresh mtime: rehome_media --prune spares recent files
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def delete(self, name):
+        if is_hashed_name(name):
+            return  # May be shared; see rehome_media --prune
+        super().delete(name)
+
+
+def media_storage():
+    """Storage for uploaded images (the `storage` callable of their ImageFields).
+
+    Content-addressed unless CONTENT_ADDRESSED_MEDIA = False in settings, in
+    which case uploads go to plain MEDIA_ROOT paths again.
+    """
+    if getattr(settings, 'CONTENT_ADDRESSED_MEDIA', True):
+        return ContentAddressedStorage()
+    return FileSystemStorage()
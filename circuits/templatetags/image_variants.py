@@ -0,0 +1,51 @@
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Template tags that render uploaded images through their
+# generated variants (see circuits/image_variants.py), so the browser downloads
+# the smallest copy that fills the displayed size.
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..image_variants import variants_for
+
+register = template.Library()
+
+
+def _attrs(attrs):
+    return format_html_join('', ' {}="{}"', attrs.items())
+
+
+def _srcset(candidates):
+    return ', '.join(f'{url} {width}w' for width, url in candidates)
+
+
+@register.simple_tag
+def responsive_img(image, sizes, **attrs):
+    """Render an ImageField file as a <picture> with WebP and fallback srcsets.
+
+    Usage: {% responsive_img circuit.layout_image sizes="200px" alt="..." class="..." %}
+
+    `sizes` is the displayed width (a CSS length or media-query list) that the
+    browser uses to choose a candidate. Any other keyword becomes an attribute
+    of the <img>. Images without variants render as a plain <img>.
+    """
+    if not image:
+        return ''
+    variants = variants_for(image)
+    if not variants:
+        return format_html('<img{}>', _attrs({'src': image.url, 'loading': 'lazy', **attrs}))
+
+    # The original closes each list, so large displays never get an upscaled copy.
+    original = [(variants.pop('source_width'), image.url)]
+    webp = variants.pop('WEBP', [])
+    fallback = next(iter(variants.values()), [])
+    img = format_html('<img{}>', _attrs({
+        'src': image.url, 'srcset': _srcset(fallback + original), 'sizes': sizes, 'loading': 'lazy', **attrs,
+    }))
+    if not webp:
+        return img
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        _srcset(webp + original), sizes, img,
+    )
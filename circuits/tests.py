@@ -1,3 +1,315 @@
-from django.test import TestCase
+# Name: Li Ziyang
+# BU Email: miclilzy@bu.edu
+# File Description: Tests for the 'circuits' application. QueryBudgetMixin
+# renders every page of an app against generated datasets of two sizes and
+# fails if any page runs more SQL queries on the larger one (an N+1 query);
+# mini_fb's tests reuse it.
 
-# Create your tests here.
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import metrics, urls as circuits_urls
+from .models import Circuit, Comment, LapTimeEntry, LeaderboardEntry, QuizAttempt
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+from .profiling import query_shape
+from .storage import ContentAddressedStorage, is_hashed_name
+
+# Numbers of synthetic users in the two datasets that are compared.
+BUDGET_DATASET_SIZES = (30, 90)
+
+
+class QueryBudgetMixin:
+    """Per-page query budget tests, mixed into a TestCase.
+
+    Subclasses list the pages of an app in budget_urls(); the test generates
+    a dataset (manage.py generate_dataset) at each of BUDGET_DATASET_SIZES,
+    renders every page with an empty cache, and asserts that the number of
+    queries is the same at both sizes. A failure prints the query shapes that
+    repeat, which is where an N+1 loop shows up.
+    """
+
+    urls_module = None  # The app's urls module
+    # URL names that are deliberately not rendered: {name: reason}
+    exempt_urls = {}
+
+    def budget_urls(self, user):
+        """Return {url name: path} for the current dataset, logged in as `user`."""
+        raise NotImplementedError
+
+    def generate_dataset(self, users):
+        call_command('generate_dataset', '--clear', '--users', str(users), '--seed', '412', stdout=StringIO())
+        cache.clear()
+        # The first synthetic user is the best-connected one in the friend graph.
+        return User.objects.get(username='synth_000000')
+
+    def measure(self, users):
+        """Render every page once; returns {url name: (status code, [sql, ...])}."""
+        user = self.generate_dataset(users)
+        results = {}
+        for name, path in self.budget_urls(user).items():
+            cache.clear()  # Measure the cold path; warm caches hide loops
+            self.client.force_login(user)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+            results[name] = (response.status_code, [query['sql'] for query in queries])
+        return results
+
+    def repeated_shapes(self, statements):
+        shapes = Counter(query_shape(sql) for sql in statements)
+        return [(n, shape) for shape, n in shapes.most_common() if n > 1]
+
+    def test_every_url_has_a_budget(self):
+        user = self.generate_dataset(BUDGET_DATASET_SIZES[0])
+        named = {p.name for p in self.urls_module.urlpatterns if isinstance(p, URLPattern) and p.name}
+        missing = named - set(self.budget_urls(user)) - set(self.exempt_urls)
+        self.assertFalse(missing, f'Add these URLs to budget_urls() or exempt_urls: {sorted(missing)}')
+
+    def test_query_count_is_constant(self):
+        small, large = (self.measure(size) for size in BUDGET_DATASET_SIZES)
+        for name in small:
+            with self.subTest(url=name):
+                status, queries = large[name]
+                self.assertLess(status, 400, f'{name} returned {status}')
+                if len(queries) == len(small[name][1]):
+                    continue
+                growing = Counter(map(query_shape, queries)) - Counter(map(query_shape, small[name][1]))
+                lines = [f'  {n}x {shape}' for n, shape in self.repeated_shapes(queries)]
+                lines += [f'  +{n} {shape}' for shape, n in growing.most_common()]
+                self.fail(
+                    f'{name}: {len(small[name][1])} queries with {BUDGET_DATASET_SIZES[0]} users, '
+                    f'{len(queries)} with {BUDGET_DATASET_SIZES[1]}. Repeated / growing query shapes:\n'
+                    + '\n'.join(lines)
+                )
+
+
+class CircuitsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urls_module = circuits_urls
+    exempt_urls = {'metrics': 'staff or token only; covered by MetricsEndpointTests'}
+
+    def budget_urls(self, user):
+        circuit = Circuit.objects.order_by('pk').first()  # The most popular circuit
+        comment = Comment.objects.create(user=user, circuit=circuit, text='Budget test.', rating=4)
+        lap_time, _ = LapTimeEntry.objects.get_or_create(
+            user=user, circuit=circuit, car='Red Bull RB20', defaults={'lap_time': '1:20.000'},
+        )
+        cache.clear()
+        url = lambda name, *args: reverse(f'circuits:{name}', args=args)
+        return {
+            'circuit_list': url('circuit_list'),
+            'circuit_markers': url('circuit_markers'),
+            'circuit_detail': url('circuit_detail', circuit.pk),
+            'comment_page': url('comment_page', circuit.pk),
+            'lap_time_page': url('lap_time_page', circuit.pk),
+            'add_comment': url('add_comment', circuit.pk),
+            'comment_update': url('comment_update', comment.pk),
+            'comment_delete': url('comment_delete', comment.pk),
+            'add_lap_time': url('add_lap_time', circuit.pk),
+            'community': url('community'),
+            'edit_profile': url('edit_profile'),
+            'user_profile': url('user_profile', user.username),
+            'laptime_update': url('laptime_update', lap_time.pk),
+            'laptime_delete': url('laptime_delete', lap_time.pk),
+            'quiz': url('quiz'),
+            'leaderboard': url('leaderboard'),
+            'test-map': url('test-map'),
+            'signup': url('signup'),
+            'profiling_stats': url('profiling_stats'),
+        }
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', password='pw-12345!')
+        self.staff = User.objects.create_user('staff', password='pw-12345!', is_staff=True)
+        self.url = reverse('circuits:metrics')
+
+    def test_staff_only_without_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE cs412_http_requests_total counter', response.content.decode())
+
+    @override_settings(METRICS={'TOKEN': 's3cret'})
+    def test_bearer_token(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_threads_share_a_fixed_number_of_shards(self):
+        threads = [
+            threading.Thread(target=metrics.observe, args=('test:threads', 200, 0.01, 3, 1000))
+            for _ in range(100)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(metrics._shards), metrics.SHARD_COUNT)
+        route = metrics.snapshot()['routes']['test:threads']
+        self.assertEqual(route['requests'], {'200': 100})
+        self.assertEqual(sum(route['buckets']['latency']), 100)
+        self.assertEqual(route['sums']['queries'], 300)
+
+
+class CommentRatingAggregateTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pw-12345!')
+        self.circuit = self.make_circuit('Monza')
+
+    def make_circuit(self, name):
+        return Circuit.objects.create(name=name, location='Italy', latitude=45.6, longitude=9.3, fun_fact='Fast.')
+
+    def assertRatings(self, circuit, count, total, histogram):
+        circuit.refresh_from_db()
+        self.assertEqual((circuit.rating_count, circuit.rating_sum), (count, total))
+        self.assertEqual(circuit.rating_histogram, {star: histogram.get(star, 0) for star in range(1, 6)})
+
+    def test_admin_created_comment_can_be_deleted_through_the_view(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:circuits_comment_add'), {
+            'user': self.admin.pk, 'circuit': self.circuit.pk, 'text': 'From the admin.', 'rating': 4,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertRatings(self.circuit, 1, 4, {4: 1})
+
+        comment = Comment.objects.get()
+        response = self.client.post(reverse('circuits:comment_delete', args=[comment.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertRatings(self.circuit, 0, 0, {})
+
+    def test_edits_moves_and_cascade_deletes_keep_counts(self):
+        other = self.make_circuit('Spa')
+        Comment.objects.create(user=self.admin, circuit=self.circuit, text='Great.', rating=5)
+
+        comment = Comment.objects.get()
+        comment.rating = 2
+        comment.save()
+        self.assertRatings(self.circuit, 1, 2, {2: 1})
+
+        comment.circuit = other
+        comment.save()
+        self.assertRatings(self.circuit, 0, 0, {})
+        self.assertRatings(other, 1, 2, {2: 1})
+
+        self.admin.delete()
+        self.assertRatings(other, 0, 0, {})
+
+
+class LeaderboardEntryTests(TestCase):
+    def attempt(self, user, score, duration_ms):
+        attempt = QuizAttempt.objects.create(
+            user=user, end_time=timezone.now(), score=score, duration_ms=duration_ms,
+        )
+        LeaderboardEntry.record_attempt(attempt)
+        return attempt
+
+    def best(self, user):
+        entry = LeaderboardEntry.objects.get(user=user)
+        return entry.attempt_id, entry.score, entry.duration_ms
+
+    def test_record_attempt_keeps_only_a_better_attempt(self):
+        user = User.objects.create_user('racer')
+        first = self.attempt(user, 7, 60000)
+        self.assertEqual(self.best(user), (first.pk, 7, 60000))
+
+        self.attempt(user, 6, 30000)  # Lower score, however fast
+        self.attempt(user, 7, 60000)  # Same score and time is not an improvement
+        self.attempt(user, 7, 65000)  # Same score, slower
+        self.assertEqual(self.best(user), (first.pk, 7, 60000))
+
+        faster = self.attempt(user, 7, 55000)
+        self.assertEqual(self.best(user), (faster.pk, 7, 55000))
+        higher = self.attempt(user, 9, 90000)
+        self.assertEqual(self.best(user), (higher.pk, 9, 90000))
+        self.assertEqual(LeaderboardEntry.objects.count(), 1)
+
+    def test_rank_of_orders_by_score_then_duration_then_id(self):
+        slow, tied_first, tied_second, top = (User.objects.create_user(name) for name in 'abcd')
+        self.attempt(slow, 8, 60000)
+        self.attempt(tied_first, 8, 50000)
+        self.attempt(tied_second, 8, 50000)  # Ties on score and time: the older entry ranks first
+        self.attempt(top, 9, 90000)
+
+        ranks = {user: LeaderboardEntry.rank_of(user).rank for user in (slow, tied_first, tied_second, top)}
+        self.assertEqual(ranks, {top: 1, tied_first: 2, tied_second: 3, slow: 4})
+        self.assertEqual(list(LeaderboardEntry.objects.values_list('user', flat=True)),
+                         [top.pk, tied_first.pk, tied_second.pk, slow.pk])
+        self.assertIsNone(LeaderboardEntry.rank_of(User.objects.create_user('new')))
+
+
+class KeysetPaginationTests(TestCase):
+    KEYS = ['-created_at', '-id']
+
+    def setUp(self):
+        user = User.objects.create_user('commenter')
+        self.circuit = Circuit.objects.create(
+            name='Suzuka', location='Japan', latitude=34.8, longitude=136.5, fun_fact='Figure eight.',
+        )
+        for i in range(5):
+            Comment.objects.create(user=user, circuit=self.circuit, text=f'Comment {i}.', rating=5)
+
+    def test_cursor_round_trip_keeps_microseconds(self):
+        created_at = timezone.now().replace(microsecond=123456)
+        token = encode_cursor([created_at, 42])
+        self.assertEqual(decode_cursor(token, Comment, self.KEYS), [created_at, 42])
+
+    def test_pages_break_ties_on_id(self):
+        # Every comment shares one created_at, so only the id orders them.
+        Comment.objects.update(created_at=timezone.now())
+        expected = list(Comment.objects.order_by('-id').values_list('pk', flat=True))
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(Comment.objects.filter(circuit=self.circuit), self.KEYS, cursor, page_size=2)
+            seen += [row.pk for row in rows]
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursors_are_rejected(self):
+        now = timezone.now()
+        for token in [
+            'not a cursor!',                        # Not base64 JSON
+            encode_cursor([now]),                   # Too few values for the keys
+            encode_cursor([[now.isoformat()], 1]),  # A list where a datetime belongs
+            encode_cursor([now, 'abc']),            # Not an id
+        ]:
+            with self.subTest(token=token), self.assertRaises(InvalidCursor):
+                decode_cursor(token, Comment, self.KEYS)
+        response = self.client.get(
+            reverse('circuits:comment_page', args=[self.circuit.pk]), {'cursor': 'not a cursor!'},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def test_names_with_non_alphanumeric_extensions_are_kept_on_delete(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        storage = ContentAddressedStorage(location=location)
+        for filename in ('backup.tar-gz', 'photo_v2.JPG', 'notes.my_ext'):
+            with self.subTest(filename=filename):
+                name = storage.save(filename, ContentFile(filename.encode()))
+                self.assertTrue(is_hashed_name(name), name)
+                self.assertEqual(storage.save(f'copy-{filename}', ContentFile(filename.encode())), name)
+                storage.delete(name)  # Shared blob: left for rehome_media --prune
+                self.assertTrue(os.path.exists(storage.path(name)))
+        self.assertTrue(is_hashed_name('ab/cd/' + 'ab' * 32 + '.Tar-GZ'))
+        self.assertFalse(is_hashed_name('images/photo.jpg'))
@@ -16,7 +16,10 @@ app_name = 'circuits'
 urlpatterns = [
     # Circuit Views
     path('', views.CircuitListView.as_view(), name='circuit_list'),         # List all circuits
+    path('markers.json', views.circuit_markers, name='circuit_markers'),    # Cached map marker JSON
     path('<int:pk>/', views.circuit_detail, name='circuit_detail'),
+    path('<int:pk>/comments/', views.comment_page, name='comment_page'),     # "Load more" comments fragment
+    path('<int:pk>/lap-times/', views.lap_time_page, name='lap_time_page'),  # "Load more" lap times fragment
 
     # Comment CRUD Views
     path('<int:pk>/comment/', views.add_comment, name='add_comment'),      # Add a comment to a circuit
@@ -46,6 +49,8 @@ urlpatterns = [
 
     # Other Views
     path('test-map/', views.test_map_view, name='test-map'),             # Test view for map functionality (if still used)
+    path('profiling/', views.profiling_stats_view, name='profiling_stats'),  # Staff-only request timing JSON
+    path('metrics/', views.metrics_view, name='metrics'),                 # Prometheus scrape endpoint
     path('signup/', views.signup, name='signup'),                         # User registration/signup page
     path('accounts/', include('django.contrib.auth.urls')), # Django auth URLs
 ]
@@ -3,19 +3,25 @@
 # File Description: Defines the view functions and classes for the 'circuits'
 # application, handling HTTP requests and rendering responses.
 
+import hashlib
+import hmac
 import json
-import random
-from datetime import datetime
-from django.db.models import Avg
+from django.db.models import Case, Q, When
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import (
     ListView,
     DetailView,
     UpdateView,
     DeleteView,
 )
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import login as auth_login
@@ -26,45 +32,69 @@ from django.contrib import messages
 from django.contrib.auth.models import User
 from .models import (
     Circuit, Comment, LapTimeEntry, Profile, # Added Profile
-    Question, Choice, QuizAttempt, Answer,
-    CONTINENT_CHOICES,
+    QuizAttempt, LeaderboardEntry,
+    CONTINENT_CHOICES, MAP_MARKERS_CACHE_KEY,
 )
 # *** Import ProfileForm ***
 from .forms import CommentForm, LapTimeForm, SignUpForm, ProfileForm # <-- Added ProfileForm
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics_settings, render_metrics
+from .pagination import InvalidCursor, keyset_page
+from .profiling import profiling_stats, reset_profiling_stats
+from .quiz import QuizSubmissionError, grade_quiz, parse_start_token, sample_questions, start_token
+from .response_cache import cache_circuit_page
+from .search import search_circuit_ids
 
 # ==============================================
 # Circuit List and Detail Views
 # ==============================================
 
+@method_decorator(cache_circuit_page('circuit_list', query_params=('q', 'continent')), name='dispatch')
 class CircuitListView(ListView):
     """
     Displays a list of F1 circuits. Supports filtering by name via a 'q'
     query parameter and by continent via a 'continent' query parameter.
-    Also prepares JSON data for the map display.
+    Map markers are fetched separately from the cached circuit_markers endpoint.
     """
     model = Circuit
     template_name = 'circuits/circuit_list.html'
     context_object_name = 'circuits'
 
     def get_queryset(self):
-        """Optionally filter circuits and annotate with average rating."""
+        """Optionally full-text search and filter circuits by continent."""
         qs = super().get_queryset()
         q = self.request.GET.get('q', '').strip()
         continent = self.request.GET.get('continent')
         if q:
-            qs = qs.filter(name__icontains=q)
+            qs = self.search(qs, q)
         if continent:
             qs = qs.filter(continent=continent)
 
-        # Annotate each circuit with its average comment rating
-        qs = qs.annotate(average_rating=Avg('comments__rating'))
-
+        # Average rating is read from the stored Circuit.rating_* columns,
+        # so no per-request aggregate over comments is needed here.
         return qs
 
+    @staticmethod
+    def search(qs, q):
+        """Restrict qs to circuits matching q, ranked by relevance.
+
+        Uses the FTS5 index (prefix matching over name, location, introduction
+        and fun fact, ordered by bm25). Falls back to icontains filtering on
+        databases without FTS5.
+        """
+        ranked_ids = search_circuit_ids(q)
+        if ranked_ids is None:
+            return qs.filter(
+                Q(name__icontains=q) | Q(location__icontains=q)
+                | Q(introduction__icontains=q) | Q(fun_fact__icontains=q)
+            )
+        if not ranked_ids:
+            return qs.none()
+        rank = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ranked_ids)])
+        return qs.filter(pk__in=ranked_ids).order_by(rank)
+
     def get_context_data(self, **kwargs):
         """
-        Adds search parameters, continent choices for dropdown, and JSON data
-        for Leaflet map markers to the context.
+        Adds search parameters and continent choices for the dropdown to the context.
         """
         context = super().get_context_data(**kwargs)
 
@@ -75,40 +105,109 @@ class CircuitListView(ListView):
         # Provide choices for the continent filter dropdown
         context['continent_choices'] = CONTINENT_CHOICES
 
-        # Prepare data structure for Leaflet map markers
-        map_data = []
-        for circuit in context['circuits']:
-            map_data.append({
-                'name': circuit.name,
-                'lat': circuit.latitude,
-                'lng': circuit.longitude,
-                'url': reverse('circuits:circuit_detail', args=[circuit.pk]),
-            })
-        context['circuits_data_json'] = json.dumps(map_data)
-
         return context
 
-# Using Function-Based View for detail as it handles more complex context
-def circuit_detail(request, pk):
-    """Displays detailed information and forms for a circuit. (FBV version)"""
-    circuit = get_object_or_404(Circuit, pk=pk)
-    comments = circuit.comments.all().order_by('-created_at') # Fetch comments
-    lap_times = circuit.lap_times.all().order_by('lap_time')   # Fetch lap times
 
-    # Initialize forms for display on the detail page
-    comment_form = CommentForm()
-    lap_time_form = LapTimeForm()
+def _map_markers():
+    """Return (json payload, etag) for every circuit's Leaflet marker.
+
+    The payload is serialized once and kept in the cache until a Circuit row
+    changes (see circuits.models.invalidate_map_markers).
+    """
+    cached = cache.get(MAP_MARKERS_CACHE_KEY)
+    if cached is None:
+        markers = [
+            {
+                'id': circuit['pk'],
+                'name': circuit['name'],
+                'lat': circuit['latitude'],
+                'lng': circuit['longitude'],
+                'url': reverse('circuits:circuit_detail', args=[circuit['pk']]),
+            }
+            for circuit in Circuit.objects.order_by('pk').values('pk', 'name', 'latitude', 'longitude')
+        ]
+        payload = json.dumps(markers)
+        cached = (payload, hashlib.sha1(payload.encode()).hexdigest())
+        cache.set(MAP_MARKERS_CACHE_KEY, cached, None)
+    return cached
+
+
+@condition(etag_func=lambda request: _map_markers()[1])
+def circuit_markers(request):
+    """Serves the map marker JSON; repeat requests with If-None-Match get a 304."""
+    payload, _ = _map_markers()
+    response = HttpResponse(payload, content_type='application/json')
+    # Let browsers keep the payload but revalidate it with the ETag each time.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+# Page sizes and keyset orderings for the comment / lap time lists on the detail page
+COMMENT_PAGE_SIZE = 20
+LAP_TIME_PAGE_SIZE = 20
+COMMENT_KEYS = ['-created_at', '-id']   # newest first
+LAP_TIME_KEYS = ['lap_ms', 'id']        # fastest first
+
+
+def _comment_page(circuit_id, cursor=None):
+    """Return one keyset page of a circuit's comments and the next cursor."""
+    qs = Comment.objects.filter(circuit_id=circuit_id).select_related('user__circuits_profile')
+    return keyset_page(qs, COMMENT_KEYS, cursor, COMMENT_PAGE_SIZE)
+
+
+def _lap_time_page(circuit_id, cursor=None):
+    """Return one keyset page of a circuit's lap times and the next cursor."""
+    qs = LapTimeEntry.objects.filter(circuit_id=circuit_id).select_related('user__circuits_profile')
+    return keyset_page(qs, LAP_TIME_KEYS, cursor, LAP_TIME_PAGE_SIZE)
+
+
+def _render_circuit_detail(request, circuit, comment_form=None, lap_time_form=None):
+    """Render the detail page with the first page of comments and lap times."""
+    comments, next_comment_cursor = _comment_page(circuit.pk)
+    lap_times, next_lap_time_cursor = _lap_time_page(circuit.pk)
 
     context = {
         'circuit': circuit,
-        'comment_form': comment_form, # Form for adding comments
-        'lap_time_form': lap_time_form, # Form for adding lap times
-        'lap_times': lap_times,         # Existing lap times list
-        'comments': comments,           # Existing comments list
+        'comment_form': comment_form or CommentForm(),    # Form for adding comments
+        'lap_time_form': lap_time_form or LapTimeForm(),  # Form for adding lap times
+        'lap_times': lap_times,                           # First page of lap times
+        'comments': comments,                             # First page of comments
+        'next_comment_cursor': next_comment_cursor,
+        'next_lap_time_cursor': next_lap_time_cursor,
     }
     return render(request, 'circuits/circuit_detail.html', context)
 
 
+# Using Function-Based View for detail as it handles more complex context
+@cache_circuit_page('circuit_detail', circuit_kwarg='pk')
+def circuit_detail(request, pk):
+    """Displays detailed information and forms for a circuit. (FBV version)"""
+    circuit = get_object_or_404(Circuit, pk=pk)
+    return _render_circuit_detail(request, circuit)
+
+
+def comment_page(request, pk):
+    """Returns the next page of a circuit's comments as an HTML fragment ("load more")."""
+    get_object_or_404(Circuit.objects.only('pk'), pk=pk)  # 404 for unknown circuits, not an empty page
+    try:
+        comments, next_cursor = _comment_page(pk, request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor.')
+    context = {'circuit_pk': pk, 'comments': comments, 'next_comment_cursor': next_cursor}
+    return render(request, 'circuits/comment_items.html', context)
+
+
+def lap_time_page(request, pk):
+    """Returns the next page of a circuit's lap times as an HTML fragment ("load more")."""
+    get_object_or_404(Circuit.objects.only('pk'), pk=pk)  # 404 for unknown circuits, not an empty page
+    try:
+        lap_times, next_cursor = _lap_time_page(pk, request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor.')
+    context = {'circuit_pk': pk, 'lap_times': lap_times, 'next_lap_time_cursor': next_cursor}
+    return render(request, 'circuits/laptime_items.html', context)
+
+
 # ==============================================
 # Comment Views
 # ==============================================
@@ -129,18 +228,8 @@ def add_comment(request, pk):
         else:
             # Re-render detail page showing comment form errors
             messages.error(request, 'Error adding comment. Please check the form.')
-            # Fetch other context needed for detail page
-            lap_times = circuit.lap_times.all().order_by('lap_time')
-            lap_time_form = LapTimeForm()
-            comments = circuit.comments.all().order_by('-created_at')
-            context = {
-                'circuit': circuit,
-                'comment_form': form, # Pass the invalid form back
-                'lap_time_form': lap_time_form,
-                'lap_times': lap_times,
-                'comments': comments,
-            }
-            return render(request, 'circuits/circuit_detail.html', context)
+            # Pass the invalid form back
+            return _render_circuit_detail(request, circuit, comment_form=form)
     else:
         # If GET request, redirect back to detail page (form is shown there)
         return redirect('circuits:circuit_detail', pk=pk)
@@ -207,19 +296,8 @@ def add_lap_time(request, circuit_pk):
             # Fall through to re-render the page with the invalid form
 
     # --- Re-render detail page on GET or failed POST ---
-    comments = circuit.comments.all().order_by('-created_at')
-    lap_times = circuit.lap_times.all().order_by('lap_time')
-    comment_form = CommentForm() # Need a fresh comment form
-
     # lap_time_form will be empty on GET, or contain errors on failed POST
-    context = {
-        'circuit': circuit,
-        'comment_form': comment_form,
-        'lap_time_form': lap_time_form, # Pass the potentially invalid form back
-        'lap_times': lap_times,
-        'comments': comments,
-    }
-    return render(request, 'circuits/circuit_detail.html', context)
+    return _render_circuit_detail(request, circuit, lap_time_form=lap_time_form)
 
 
 # ==============================================
@@ -231,88 +309,82 @@ def quiz_view(request):
     """Renders the quiz page (GET) or processes submitted answers (POST)."""
     if request.method == 'POST':
         # --- Process submitted quiz ---
-        start_time_str = request.POST.get('start_time')
         try:
-            start_time = datetime.fromisoformat(start_time_str)
-        except (ValueError, TypeError):
+            start_time = parse_start_token(request.POST.get('start_time'), request.user)
+        except QuizSubmissionError:
             messages.error(request, "Invalid quiz start time.")
             return redirect('circuits:quiz') # Redirect back to quiz start
 
         end_time = timezone.now()
 
-        attempt = QuizAttempt.objects.create(
-            user=request.user, start_time=start_time, end_time=end_time, score=0
-        )
-
-        score = 0
-        question_ids = request.POST.getlist('question_ids')
-        # Ensure questions exist and handle potential errors
-        questions = Question.objects.filter(id__in=question_ids)
-        if len(question_ids) != questions.count():
-             messages.error(request, "Error processing quiz questions.")
-             attempt.delete() # Clean up incomplete attempt
-             return redirect('circuits:quiz')
-
-        for q in questions:
-            choice_id = request.POST.get(f'question_{q.id}')
-            is_correct_answer = False
-            selected_choice = None
-
-            if choice_id:
-                try:
-                    choice = Choice.objects.select_related('question').get(id=int(choice_id))
-                    # Verify choice belongs to the question being processed
-                    if choice.question == q:
-                        selected_choice = choice
-                        if choice.is_correct:
-                            score += 1
-                            is_correct_answer = True
-                    else:
-                        # Handle case where submitted choice_id doesn't match question
-                         messages.warning(request, f"Submitted choice for question '{q.text}' was invalid.")
-                except (Choice.DoesNotExist, ValueError):
-                     messages.warning(request, f"Invalid choice submitted for question '{q.text}'.")
-
-            # Record the answer
-            Answer.objects.create(
-                attempt=attempt, question=q,
-                selected_choice=selected_choice, is_correct=is_correct_answer
+        try:
+            attempt, warnings = grade_quiz(
+                request.user, start_time, end_time,
+                request.POST.getlist('question_ids'), request.POST,
             )
+        except QuizSubmissionError:
+            messages.error(request, "Error processing quiz questions.")
+            return redirect('circuits:quiz')
 
-        attempt.score = score
-        attempt.save()
+        for warning in warnings:
+            messages.warning(request, warning)
+        score = attempt.score
         messages.success(request, f"Quiz submitted! Your score: {score}")
         return redirect('circuits:leaderboard')
 
     # --- Handle GET request: Prepare and render the quiz ---
-    all_questions = list(Question.objects.all())
-    num_questions_to_sample = min(len(all_questions), 6)
-    if num_questions_to_sample < 1:
+    # Sampled over the cached question id pool; choices are prefetched.
+    sampled_questions = sample_questions()
+    if not sampled_questions:
          messages.warning(request, "No quiz questions available.")
          # Maybe redirect somewhere else or render template with message
          return render(request, 'circuits/quiz.html', {'questions': []})
 
-    sampled_questions = random.sample(all_questions, num_questions_to_sample)
-
     context = {
         'questions': sampled_questions,
         'question_ids': [q.id for q in sampled_questions],
-        'now': timezone.now().isoformat(),
+        'start_token': start_token(request.user),  # Signed server-side start time
     }
     return render(request, 'circuits/quiz.html', context)
 
 
 class LeaderboardView(ListView):
-    """Displays top quiz attempts sorted by score and time."""
-    model = QuizAttempt
+    """Displays each user's best quiz attempt, ranked by score then time.
+
+    Reads the maintained LeaderboardEntry table and pages through it with
+    keyset cursors, so deep pages cost the same as the first one.
+    """
+    model = LeaderboardEntry
     template_name = 'circuits/leaderboard.html'
-    context_object_name = 'attempts'
-    paginate_by = 20 # Optional: Add pagination
+    context_object_name = 'entries'
+    page_size = 20
 
     def get_queryset(self):
-        """Returns top attempts ordered by score (desc) and duration (asc)."""
-        # Select related user for efficiency in template
-        return QuizAttempt.objects.select_related('user').order_by('-score', 'end_time')
+        """Returns leaderboard entries with their users (ordering applied by keyset_page)."""
+        return LeaderboardEntry.objects.select_related('user')
+
+    def get(self, request, *args, **kwargs):
+        """Loads one keyset page of entries starting after the 'cursor' parameter."""
+        self.cursor = request.GET.get('cursor')
+        try:
+            self.object_list, self.next_cursor = keyset_page(
+                self.get_queryset(), LeaderboardEntry.RANK_KEYS, self.cursor, self.page_size
+            )
+        except InvalidCursor:
+            return HttpResponseBadRequest('Invalid cursor.')
+        return self.render_to_response(self.get_context_data())
+
+    def get_context_data(self, **kwargs):
+        """Adds the rank of the page's first row, the next cursor and the viewer's own rank."""
+        context = super().get_context_data(**kwargs)
+        first_rank = 1
+        if self.cursor and self.object_list:
+            first_rank = LeaderboardEntry.rank_of(self.object_list[0].user).rank
+        context['first_rank'] = first_rank
+        context['next_cursor'] = self.next_cursor
+        if self.request.user.is_authenticated:
+            context['my_entry'] = LeaderboardEntry.rank_of(self.request.user)
+        return context
 
 
 # ==============================================
@@ -396,10 +468,15 @@ def user_profile_view(request, username):
     user_comments = Comment.objects.filter(user=target_user).select_related('circuit').order_by('-created_at')
 
     # Fetch lap times submitted by this user, optimize by prefetching related Circuit
-    user_lap_times = LapTimeEntry.objects.filter(user=target_user).select_related('circuit').order_by('circuit__name', 'lap_time')
-
-    # --- NEW: Get user's highest quiz score ---
-    highest_quiz_attempt = QuizAttempt.objects.filter(user=target_user).order_by('-score').first()
+    user_lap_times = LapTimeEntry.objects.filter(user=target_user).select_related('circuit').order_by('circuit__name', 'lap_ms')
+
+    # --- NEW: Get user's best quiz attempt (highest score, then fastest) ---
+    highest_quiz_attempt = (
+        QuizAttempt.objects.filter(user=target_user)
+        .order_by('-score', 'duration_ms')
+        .only('score', 'duration_ms')
+        .first()
+    )
     # If the user has attempts, get the score, otherwise set to None or a placeholder like 'N/A'
     highest_score = highest_quiz_attempt.score if highest_quiz_attempt else None
 
@@ -409,6 +486,7 @@ def user_profile_view(request, username):
         'lap_times': user_lap_times,    # List of lap times by this user
         'is_own_profile': request.user == target_user, # Add flag to check if viewing own profile
         'highest_quiz_score': highest_score,
+        'highest_quiz_attempt': highest_quiz_attempt,
     }
     return render(request, 'circuits/user_profile.html', context)
 
@@ -459,4 +537,33 @@ def test_map_view(request):
     # Consider removing or securing this if not needed in production
     return render(request, 'circuits/test_map.html')
 
+
+@staff_member_required
+def profiling_stats_view(request):
+    """Staff-only JSON of the slowest routes and most repeated queries since start
+    (or since the last ?reset=1), as collected by ProfilingMiddleware."""
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 200)
+    except ValueError:
+        limit = 20
+    stats = profiling_stats(limit=limit)
+    if request.GET.get('reset'):
+        reset_profiling_stats()
+    return JsonResponse(stats)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint. The scraper sends METRICS['TOKEN'] as
+    'Authorization: Bearer <token>'; without a configured token only staff
+    users can read it."""
+    token = metrics_settings()['TOKEN']
+    if token:
+        # Constant-time comparison; bytes, since compare_digest rejects non-ASCII str
+        expected = f'Bearer {token}'.encode()
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+            return HttpResponse('Missing or wrong metrics token.', status=401, content_type='text/plain')
+    elif not request.user.is_staff:
+        return HttpResponse('Metrics need METRICS_TOKEN or a staff login.', status=403, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 # --- End of views.py ---
\ No newline at end of file
@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs412.settings')
 
 application = get_asgi_application()
+
+# Opt-in sampling profiler; returns the application unchanged unless
+# settings.SAMPLING_PROFILER is enabled.
+from circuits.sampling import wrap_asgi  # noqa: E402
+
+application = wrap_asgi(application)
@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover every other middleware (Server-Timing header)
+    'circuits.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +61,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request timing in ProfilingMiddleware (Server-Timing header, template
+# timing, circuits:profiling_stats). Set REQUEST_PROFILING=0 to keep only
+# the Prometheus request metrics.
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', '1') == '1'
+
 ROOT_URLCONF = 'cs412.urls'
 
 TEMPLATES = [
@@ -91,6 +98,48 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Used for the circuits map markers and public page response cache.
+# Swap in the file-based backend to share entries between worker processes:
+#   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#   'LOCATION': BASE_DIR / 'cache',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cs412',
+    }
+}
+
+
+# Sampling profiler for live traffic (circuits/sampling.py), applied in
+# wsgi.py and asgi.py. Off unless SAMPLING_PROFILER=1 is set in the
+# environment; merge the output with `manage.py merge_profiles`.
+
+SAMPLING_PROFILER = {
+    'ENABLED': os.environ.get('SAMPLING_PROFILER') == '1',
+    'RATE': float(os.environ.get('SAMPLING_PROFILER_RATE', '0.01')),
+    'URL_NAMES': [name for name in os.environ.get('SAMPLING_PROFILER_URL_NAMES', '').split(',') if name],
+    'HEADER_TOKEN': os.environ.get('SAMPLING_PROFILER_TOKEN'),
+    'MODE': os.environ.get('SAMPLING_PROFILER_MODE', 'stack'),
+    'DIR': os.path.join(BASE_DIR, 'profiles'),
+    'MAX_FILES': 500,
+}
+
+
+# Prometheus metrics at /circuits/metrics/ (circuits/metrics.py). Set
+# METRICS_MULTIPROCESS_DIR when running several worker processes so the
+# endpoint reports the totals of all of them. Scrapers authenticate with
+# METRICS_TOKEN as a bearer token; without one only staff can read it.
+
+METRICS = {
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_MULTIPROCESS_DIR'),
+    'TABLES': ['circuits.QuizAttempt', 'circuits.Answer', 'mini_fb.StatusMessage', 'mini_fb.Friend'],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -5,11 +5,12 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Profile, StatusMessage, Image, StatusImage, Friend
+from .models import Profile, StatusMessage, Image, StatusImage, Friend, FeedEntry
 
 # Register the Profile model to make it accessible in the Django admin interface.
 admin.site.register(Profile)
 admin.site.register(StatusMessage)
 admin.site.register(Image)
 admin.site.register(StatusImage)
-admin.site.register(Friend)
\ No newline at end of file
+admin.site.register(Friend)
+admin.site.register(FeedEntry)
@@ -0,0 +1,231 @@
+# mini_fb/management/commands/load_social_graph.py
+
+import csv
+import json
+import os
+import time
+from functools import lru_cache
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from circuits.models import Profile as CircuitsProfile
+from mini_fb.models import FeedEntry, Friend, Profile, StatusMessage, invalidate_friend_caches
+
+
+def read_rows(path):
+    """Stream dict rows from a .csv (with header) or .jsonl file, one at a time."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as f:
+        if ext == '.csv':
+            yield from csv.DictReader(f)
+        elif ext in ('.jsonl', '.ndjson'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise CommandError(f'Unsupported file type for {path} (use .csv or .jsonl).')
+
+
+def batched(rows, size):
+    """Yield lists of at most `size` rows, holding only one batch in memory."""
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+@lru_cache(maxsize=64)
+def hashed_password(raw):
+    """Hash each distinct raw password once; seeded users often share one."""
+    return make_password(raw or None)
+
+
+class Command(BaseCommand):
+    help = ('Bulk load users, mini_fb Profiles, Friend edges and StatusMessages from '
+            'CSV/JSONL files, streaming them in batches.')
+
+    # Columns read from each file (CSV header or JSONL keys). Profiles are
+    # referenced everywhere by their (unique) email.
+    #   users:    username, email, password
+    #   profiles: email, first_name, last_name, city, profile_image_url, username
+    #   friends:  profile1, profile2            (profile emails)
+    #   statuses: profile, message, timestamp   (profile email, ISO 8601 time)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', help='Users file (.csv or .jsonl).')
+        parser.add_argument('--profiles', help='Profiles file (.csv or .jsonl).')
+        parser.add_argument('--friends', help='Friend edges file (.csv or .jsonl).')
+        parser.add_argument('--statuses', help='Status messages file (.csv or .jsonl).')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per bulk insert and per transaction (default 2000).')
+        parser.add_argument('--skip-feeds', action='store_true',
+                            help='Do not add loaded friendships and statuses to news feed timelines '
+                                 '(run rebuild_news_feeds afterwards instead).')
+
+    def handle(self, *args, **options):
+        steps = [
+            ('users', self.load_users),
+            ('profiles', self.load_profiles),
+            ('friends', self.load_friends),
+            ('statuses', self.load_statuses),
+        ]
+        if not any(options[name] for name, _ in steps):
+            raise CommandError('Give at least one of --users, --profiles, --friends, --statuses.')
+        self.skip_feeds = options['skip_feeds']
+        self.batch_size = options['batch_size']
+
+        for name, loader in steps:
+            if not options[name]:
+                continue
+            started = time.perf_counter()
+            created = skipped = 0
+            for batch in batched(read_rows(options[name]), options['batch_size']):
+                with transaction.atomic():
+                    n_created, n_skipped = loader(batch)
+                created += n_created
+                skipped += n_skipped
+            elapsed = time.perf_counter() - started
+            rate = (created + skipped) / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {name}: {created} created, {skipped} skipped in {elapsed:.1f}s ({rate:,.0f} rows/s).'
+            ))
+
+    def _profile_ids(self, emails):
+        """Per-batch id map: profile email -> pk, in one query."""
+        return dict(Profile.objects.filter(email__in=set(emails)).values_list('email', 'pk'))
+
+    def load_users(self, rows):
+        existing = set(User.objects.filter(username__in=[r['username'] for r in rows])
+                       .values_list('username', flat=True))
+        users = []
+        for row in rows:
+            if row['username'] in existing:
+                continue
+            existing.add(row['username'])  # also skips repeats within the batch
+            users.append(User(username=row['username'], email=row.get('email') or '',
+                              password=hashed_password(row.get('password') or '')))
+        User.objects.bulk_create(users)
+        # bulk_create skips the post_save receiver that gives every User its
+        # circuits Profile; without one the user cannot log in.
+        user_ids = User.objects.filter(username__in=[u.username for u in users]).values_list('pk', flat=True)
+        CircuitsProfile.objects.bulk_create(
+            [CircuitsProfile(user_id=pk) for pk in user_ids], ignore_conflicts=True,
+        )
+        return len(users), len(rows) - len(users)
+
+    def load_profiles(self, rows):
+        existing = set(self._profile_ids(r['email'] for r in rows))
+        user_ids = dict(User.objects.filter(username__in=[r['username'] for r in rows if r.get('username')])
+                        .values_list('username', 'pk'))
+        profiles = []
+        for row in rows:
+            if row['email'] in existing:
+                continue
+            existing.add(row['email'])
+            profiles.append(Profile(
+                email=row['email'], first_name=row['first_name'], last_name=row['last_name'],
+                city=row.get('city') or '', profile_image_url=row.get('profile_image_url') or '',
+                user_id=user_ids.get(row.get('username')),
+            ))
+        Profile.objects.bulk_create(profiles, ignore_conflicts=True)
+        return len(profiles), len(rows) - len(profiles)
+
+    def load_friends(self, rows):
+        ids = self._profile_ids([r['profile1'] for r in rows] + [r['profile2'] for r in rows])
+        pairs = [(ids.get(r['profile1']), ids.get(r['profile2'])) for r in rows]
+        pairs = [(a, b) for a, b in pairs if a and b and a != b]
+
+        # A friendship is one edge in either direction
+        seen = self._existing_friendships({frozenset(pair) for pair in pairs})
+        friends = []
+        for a, b in pairs:
+            if frozenset((a, b)) in seen:
+                continue
+            seen.add(frozenset((a, b)))
+            friends.append(Friend(profile1_id=a, profile2_id=b))
+        Friend.objects.bulk_create(friends, ignore_conflicts=True)
+
+        # bulk_create sends no post_save, so fan out what add_friendship_to_feeds would
+        if friends and not self.skip_feeds:
+            profiles = Profile.objects.only('pk', 'feed_fan_out').in_bulk(
+                {pk for friend in friends for pk in (friend.profile1_id, friend.profile2_id)}
+            )
+            for friend in friends:
+                FeedEntry.add_friendship(profiles[friend.profile1_id], profiles[friend.profile2_id])
+
+        # bulk_create sends no post_save, so invalidate what invalidate_friend_ids would
+        invalidate_friend_caches({pk for friend in friends for pk in (friend.profile1_id, friend.profile2_id)})
+        return len(friends), len(rows) - len(friends)
+
+    def _existing_friendships(self, pairs, chunk_size=240):
+        """Return which of `pairs` (frozensets of two profile ids) already exist,
+        in either direction, probing the unique (profile1, profile2) index."""
+        table = connection.ops.quote_name(Friend._meta.db_table)
+        # Both directions of every pair; chunked to stay under 999 query parameters
+        edges = [edge for a, b in map(tuple, pairs) for edge in ((a, b), (b, a))]
+        found = set()
+        with connection.cursor() as cursor:
+            for start in range(0, len(edges), chunk_size * 2):
+                chunk = edges[start:start + chunk_size * 2]
+                values = ', '.join(['(%s, %s)'] * len(chunk))
+                cursor.execute(
+                    f'SELECT profile1_id, profile2_id FROM {table} '
+                    f'WHERE (profile1_id, profile2_id) IN (VALUES {values})',
+                    [pk for edge in chunk for pk in edge],
+                )
+                found.update(frozenset(row) for row in cursor.fetchall())
+        return found
+
+    def load_statuses(self, rows):
+        ids = self._profile_ids(r['profile'] for r in rows)
+        fields = [StatusMessage._meta.get_field(name) for name in ('timestamp', 'message', 'profile')]
+        statuses, profile_ids, timestamps = [], [], []
+        for row in rows:
+            profile_id = ids.get(row['profile'])
+            if profile_id is None:
+                continue
+            try:
+                timestamp = parse_datetime(row['timestamp']) if row.get('timestamp') else timezone.now()
+            except ValueError:  # Well-formed but impossible, e.g. month 13
+                timestamp = None
+            if timestamp is None:
+                continue  # Malformed timestamp: counted as skipped
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+            statuses.append([
+                field.get_db_prep_save(value, connection)
+                for field, value in zip(fields, (timestamp, row['message'], profile_id))
+            ])
+            profile_ids.append(profile_id)
+            timestamps.append(timestamp)
+
+        # A plain INSERT keeps the file's timestamps; bulk_create would run
+        # the field's auto_now_add pre_save and overwrite them. Rows are
+        # inserted one at a time (in the batch's transaction) to learn their
+        # ids, which the feed fan-out needs.
+        table = StatusMessage._meta.db_table
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        status_ids = []
+        with connection.cursor() as cursor:
+            for values in statuses:
+                cursor.execute(sql, values)
+                status_ids.append(connection.ops.last_insert_id(cursor, table, StatusMessage._meta.pk.column))
+
+        # No post_save either: fan the new statuses out as fan_out_status_message would
+        if statuses and not self.skip_feeds:
+            authors = Profile.objects.only('pk', 'feed_fan_out').in_bulk(set(profile_ids))
+            FeedEntry.fan_out_many(
+                [StatusMessage(pk=pk, profile=authors[profile_id], timestamp=timestamp)
+                 for pk, profile_id, timestamp in zip(status_ids, profile_ids, timestamps)],
+                batch_size=self.batch_size,
+            )
+        return len(statuses), len(rows) - len(statuses)
@@ -0,0 +1,34 @@
+# mini_fb/management/commands/rebuild_news_feeds.py
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.core.management.base import BaseCommand
+
+from mini_fb.models import FeedEntry, Profile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every news feed timeline (FeedEntry) from status messages and friendships.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pull-threshold', type=int, default=None,
+            help='Switch profiles with more than this many friends to pull mode '
+                 '(and every other profile to fan-out mode) before rebuilding.',
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['pull_threshold']
+        with transaction.atomic():
+            if threshold is not None:
+                degrees = Profile.objects.annotate(
+                    degree=Count('friends_profile1', distinct=True) + Count('friends_profile2', distinct=True)
+                )
+                pull_ids = list(degrees.filter(degree__gt=threshold).values_list('pk', flat=True))
+                Profile.objects.filter(pk__in=pull_ids).update(feed_fan_out=False)
+                Profile.objects.filter(~Q(pk__in=pull_ids)).update(feed_fan_out=True)
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️ {len(pull_ids)} profile(s) with more than {threshold} friends set to pull mode.'
+                ))
+            written = FeedEntry.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt news feeds with {written} entries.'))
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_feed_entries(apps, schema_editor):
+    """Fan every existing status message out to its author and the author's friends."""
+    Friend = apps.get_model('mini_fb', 'Friend')
+    StatusMessage = apps.get_model('mini_fb', 'StatusMessage')
+    FeedEntry = apps.get_model('mini_fb', 'FeedEntry')
+    friends = {}
+    for p1, p2 in Friend.objects.values_list('profile1_id', 'profile2_id').iterator(chunk_size=2000):
+        friends.setdefault(p1, set()).add(p2)
+        friends.setdefault(p2, set()).add(p1)
+    batch = []
+    for pk, author_id, timestamp in StatusMessage.objects.values_list('pk', 'profile_id', 'timestamp').iterator(chunk_size=2000):
+        batch += [
+            FeedEntry(owner_id=owner_id, status_message_id=pk, author_id=author_id, timestamp=timestamp)
+            for owner_id in {author_id, *friends.get(author_id, ())}
+        ]
+        if len(batch) >= 2000:
+            FeedEntry.objects.bulk_create(batch)
+            batch = []
+    FeedEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0009_alter_profile_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='feed_fan_out',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mini_fb.profile')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='mini_fb.profile')),
+                ('status_message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='mini_fb.statusmessage')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['owner', '-timestamp', '-status_message'], name='feedentry_timeline_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='feedentry',
+            unique_together={('owner', 'status_message')},
+        ),
+        migrations.RunPython(backfill_feed_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:44
+
+import circuits.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0010_feedentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='image_file',
+            field=models.ImageField(storage=circuits.storage.media_storage, upload_to='images/'),
+        ),
+    ]
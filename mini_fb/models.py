@@ -2,9 +2,26 @@
 # Author: Li Ziyang (miclilzy@bu.edu), 02/21/2025
 # Description: Defines the Profile model, which represents user profile information 
 # in the Django application, including name, city, email, and profile image URL.
-from django.db import models
+from array import array
+from bisect import bisect_left
+
+from django.db import connection, models, transaction
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from circuits.storage import media_storage
+
+# Cache key of a profile's friend-id adjacency (a sorted array of ints).
+FRIEND_IDS_CACHE_KEY = 'mini_fb:friend_ids:{}'
+# Cache key of a profile's ranked friend suggestions (a list of (id, mutual count)).
+FRIEND_SUGGESTIONS_CACHE_KEY = 'mini_fb:friend_suggestions:{}'
+# Number of ranked suggestions computed and cached per profile.
+FRIEND_SUGGESTION_LIMIT = 20
+# Number of an author's latest status messages copied into a new friend's feed.
+FEED_BACKFILL_LIMIT = 50
 
 
 
@@ -21,6 +38,17 @@ class Profile(models.Model):
     profile_image_url = models.CharField(max_length=50)
     # link profile to Django User
     user = models.ForeignKey(User, on_delete = models.CASCADE, null = True, related_name='mini_fb_profile')
+    # Push this profile's status messages into its friends' feeds when posted (fan-out
+    # on write). Turn off for very high-degree profiles; their posts are then pulled
+    # into each friend's feed at read time instead.
+    feed_fan_out = models.BooleanField(default=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember feed_fan_out as loaded, so switching it on can backfill the feeds."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_feed_fan_out = instance.__dict__.get('feed_fan_out')
+        return instance
 
     # returns a readable representation of the profile).
     def __str__(self):
@@ -48,20 +76,42 @@ class Profile(models.Model):
         """
         return reverse("show_profile", kwargs={"pk": self.pk})
     
-    def get_friends(self):
+    def get_friend_ids(self):
         """
-        Returns a list of Profile objects that are friends with this Profile.
+        Returns the ids of this profile's friends as a sorted array of ints.
+        The array is cached per profile (and memoized on the instance) until a
+        Friend row involving this profile is saved or deleted.
         """
-        # Retrieve all Friend instances where this profile is profile1 or profile2
-        friends = Friend.objects.filter(profile1=self) | Friend.objects.filter(profile2=self)
+        if getattr(self, '_friend_ids', None) is None:
+            key = FRIEND_IDS_CACHE_KEY.format(self.pk)
+            ids = cache.get(key)
+            if ids is None:
+                pairs = Friend.objects.filter(
+                    models.Q(profile1_id=self.pk) | models.Q(profile2_id=self.pk)
+                ).values_list('profile1_id', 'profile2_id')
+                ids = array('q', sorted({p2 if p1 == self.pk else p1 for p1, p2 in pairs}))
+                cache.set(key, ids, None)
+            self._friend_ids = ids
+        return self._friend_ids
 
-        # Extract the Profile objects (excluding self)
-        friend_profiles = [
-            friend.profile2 if friend.profile1 == self else friend.profile1
-            for friend in friends
-        ]
+    def is_friend(self, other):
+        """
+        Returns True if `other` (a Profile or a profile id) is a friend of this profile.
+        Answered by binary search over the cached adjacency, without a query.
+        """
+        other_id = getattr(other, 'pk', other)
+        ids = self.get_friend_ids()
+        i = bisect_left(ids, other_id)
+        return i < len(ids) and ids[i] == other_id
 
-        return friend_profiles
+    def get_friends(self):
+        """
+        Returns a list of Profile objects that are friends with this Profile.
+        """
+        # Resolve the cached friend ids with a single in_bulk query
+        friend_ids = self.get_friend_ids()
+        profiles = Profile.objects.in_bulk(list(friend_ids))
+        return [profiles[pk] for pk in friend_ids if pk in profiles]
     
     def add_friend(self, other):
         """
@@ -70,38 +120,87 @@ class Profile(models.Model):
         if self == other:
             return  # Prevent self-friending
 
-        # Check if the friendship already exists
-        friendship_exists = Friend.objects.filter(
-            models.Q(profile1=self, profile2=other) | models.Q(profile1=other, profile2=self)
-        ).exists()
-
-        if not friendship_exists:
+        # Check if the friendship already exists (cached adjacency, no query)
+        if not self.is_friend(other):
             Friend.objects.create(profile1=self, profile2=other)
+            self._friend_ids = None
 
-    def get_friend_suggestions(self):
+    def get_friend_suggestions(self, limit=None):
         """
-        Returns a list of potential friends that the user is not yet friends with.
+        Returns up to `limit` suggested friends, best first, as Profile objects
+        carrying a `mutual_friend_count` attribute.
+
+        Candidates are friends-of-friends ranked by how many friends they share
+        with this profile; if there are fewer than FRIEND_SUGGESTION_LIMIT of
+        them the list is topped up with other (non-friend) profiles. The ranked
+        ids are cached per profile until a friendship around it changes.
         """
-        # Get IDs of current friends
-        friend_ids = [friend.pk for friend in self.get_friends()]
+        key = FRIEND_SUGGESTIONS_CACHE_KEY.format(self.pk)
+        ranked = cache.get(key)
+        if ranked is None:
+            ranked = self._rank_friend_suggestions(FRIEND_SUGGESTION_LIMIT)
+            cache.set(key, ranked, 60 * 60)
 
-         # Return all profiles excluding self and existing friends
-        return Profile.objects.exclude(pk=self.pk).exclude(pk__in=friend_ids)
-    
-    def get_news_feed(self):
+        ranked = ranked[:limit] if limit is not None else ranked
+        profiles = Profile.objects.in_bulk([pk for pk, _ in ranked])
+        suggestions = []
+        for pk, mutual_count in ranked:
+            if pk in profiles:  # skip profiles deleted since the list was cached
+                profiles[pk].mutual_friend_count = mutual_count
+                suggestions.append(profiles[pk])
+        return suggestions
+
+    def _rank_friend_suggestions(self, limit):
+        """
+        Scores friends-of-friends by mutual-friend count in one grouped query.
+        Returns a list of (profile id, mutual friend count), highest count first.
         """
-        Returns a queryset of status messages from the profile and its friends, sorted by timestamp.
+        table = connection.ops.quote_name(Friend._meta.db_table)
+        # Friend rows are undirected, so each edge is read in both directions.
+        # Only the two-hop neighbourhood is visited: the profile's own edges,
+        # then the edges of those friends, each through the profile1/profile2
+        # foreign key indexes.
+        sql = f"""
+            WITH mine (friend_id) AS (
+                SELECT profile2_id FROM {table} WHERE profile1_id = %s
+                UNION ALL
+                SELECT profile1_id FROM {table} WHERE profile2_id = %s
+            ),
+            edges (src, dst) AS (
+                SELECT f.profile1_id, f.profile2_id FROM {table} f JOIN mine ON f.profile1_id = mine.friend_id
+                UNION ALL
+                SELECT f.profile2_id, f.profile1_id FROM {table} f JOIN mine ON f.profile2_id = mine.friend_id
+            )
+            SELECT edges.dst, COUNT(DISTINCT edges.src) AS mutual
+            FROM edges
+            WHERE edges.dst <> %s
+              AND edges.dst NOT IN (SELECT friend_id FROM mine)
+            GROUP BY edges.dst
+            ORDER BY mutual DESC, edges.dst
+            LIMIT %s
         """
-        # Get the list of friends
-        friends = self.get_friends()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk, self.pk, self.pk, limit])
+            ranked = [(pk, mutual) for pk, mutual in cursor.fetchall()]
 
-        # Get status messages for this profile and their friends
-        status_messages = StatusMessage.objects.filter(
-            models.Q(profile=self) | models.Q(profile__in=friends)
-        ).order_by('-timestamp')  # Most recent first
+        if len(ranked) < limit:
+            # Not enough friends-of-friends (e.g. a new profile): fill in with others
+            exclude_ids = [pk for pk, _ in ranked] + list(self.get_friend_ids()) + [self.pk]
+            fillers = (Profile.objects.exclude(pk__in=exclude_ids)
+                       .order_by('-pk').values_list('pk', flat=True)[:limit - len(ranked)])
+            ranked += [(pk, 0) for pk in fillers]
+        return ranked
+
+    def get_pull_friend_ids(self):
+        """
+        Returns the ids of friends in pull mode (feed_fan_out=False), whose
+        status messages are not in this profile's FeedEntry timeline.
+        """
+        friend_ids = list(self.get_friend_ids())
+        if not friend_ids:
+            return []
+        return list(Profile.objects.filter(pk__in=friend_ids, feed_fan_out=False).values_list('pk', flat=True))
 
-        return status_messages
-    
     def __str__(self):
         return self.user.username
     
@@ -117,7 +216,7 @@ class StatusMessage(models.Model):
     
 class Image(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
-    image_file = models.ImageField(upload_to='images/')
+    image_file = models.ImageField(upload_to='images/', storage=media_storage)
     timestamp = models.DateTimeField(auto_now_add=True)
     caption = models.TextField(blank = True, null = True)
 
@@ -125,6 +224,141 @@ class StatusImage(models.Model):
     status_message = models.ForeignKey(StatusMessage, on_delete = models.CASCADE)
     image = models.ForeignKey(Image, on_delete = models.CASCADE)
 
+class FeedEntry(models.Model):
+    """
+    One status message in one profile's news feed timeline. Rows are written
+    when a status is posted (fan-out on write) so reading a feed is a single
+    indexed scan of the owner's timeline.
+    """
+    owner = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='feed_entries')
+    status_message = models.ForeignKey(StatusMessage, on_delete=models.CASCADE, related_name='feed_entries')
+    author = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+')
+    timestamp = models.DateTimeField()  # copy of status_message.timestamp
+
+    class Meta:
+        unique_together = ('owner', 'status_message')
+        indexes = [
+            models.Index(fields=['owner', '-timestamp', '-status_message'], name='feedentry_timeline_idx'),
+        ]
+
+    def __str__(self):
+        return f"Status {self.status_message_id} in feed of profile {self.owner_id}"
+
+    @classmethod
+    def fan_out(cls, status_message):
+        """
+        Inserts a new status message into its author's timeline and, if the
+        author is in fan-out mode, into every friend's timeline, in one bulk insert.
+        """
+        cls.fan_out_many([status_message])
+
+    @classmethod
+    def fan_out_many(cls, status_messages, batch_size=1000):
+        """
+        fan_out() for several new status messages (e.g. a bulk-loaded batch),
+        written with one bulk insert. Each message's `profile` must be loaded.
+        """
+        entries = []
+        for status_message in status_messages:
+            author = status_message.profile
+            owner_ids = [author.pk]
+            if author.feed_fan_out:
+                owner_ids += author.get_friend_ids()
+            entries += [
+                cls(owner_id=owner_id, status_message_id=status_message.pk,
+                    author_id=author.pk, timestamp=status_message.timestamp)
+                for owner_id in owner_ids
+            ]
+        cls.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+
+    @classmethod
+    def add_friendship(cls, profile_a, profile_b):
+        """
+        Copies each side's latest status messages into the other's timeline
+        (only for authors in fan-out mode; pull-mode posts are read directly).
+        """
+        entries = []
+        for author, owner in ((profile_a, profile_b), (profile_b, profile_a)):
+            if not author.feed_fan_out:
+                continue
+            recent = (StatusMessage.objects.filter(profile=author)
+                      .order_by('-timestamp', '-id').values_list('pk', 'timestamp')[:FEED_BACKFILL_LIMIT])
+            entries += [
+                cls(owner_id=owner.pk, status_message_id=pk, author_id=author.pk, timestamp=timestamp)
+                for pk, timestamp in recent
+            ]
+        cls.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+    @classmethod
+    def backfill_author(cls, author, batch_size=2000):
+        """
+        Copies every status message of `author` into its friends' timelines,
+        for a profile switched from pull to fan-out mode. Returns the number
+        of entries written (existing ones are kept).
+        """
+        friend_ids = list(author.get_friend_ids())
+        if not friend_ids:
+            return 0
+        written = 0
+        batch = []
+        statuses = (StatusMessage.objects.filter(profile=author)
+                    .values_list('pk', 'timestamp').iterator(chunk_size=batch_size))
+        for pk, timestamp in statuses:
+            batch += [
+                cls(owner_id=owner_id, status_message_id=pk, author_id=author.pk, timestamp=timestamp)
+                for owner_id in friend_ids
+            ]
+            if len(batch) >= batch_size:
+                cls.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=True)
+                written += len(batch)
+                batch = []
+        cls.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=True)
+        return written + len(batch)
+
+    @classmethod
+    def remove_friendship(cls, profile_a_id, profile_b_id):
+        """
+        Retracts each side's status messages from the other's timeline.
+        """
+        cls.objects.filter(
+            models.Q(owner_id=profile_a_id, author_id=profile_b_id)
+            | models.Q(owner_id=profile_b_id, author_id=profile_a_id)
+        ).delete()
+
+    @classmethod
+    def rebuild(cls, batch_size=2000):
+        """
+        Rebuilds every timeline from StatusMessage and Friend. Friendships are
+        read once into an in-memory adjacency and status messages are streamed,
+        so the whole backfill is a handful of queries plus batched inserts.
+        Returns the number of entries written.
+        """
+        friends = {}
+        for p1, p2 in Friend.objects.values_list('profile1_id', 'profile2_id').iterator(chunk_size=batch_size):
+            friends.setdefault(p1, set()).add(p2)
+            friends.setdefault(p2, set()).add(p1)
+        fan_out_ids = set(Profile.objects.filter(feed_fan_out=True).values_list('pk', flat=True))
+
+        cls.objects.all().delete()
+        written = 0
+        batch = []
+        statuses = StatusMessage.objects.values_list('pk', 'profile_id', 'timestamp').iterator(chunk_size=batch_size)
+        for pk, author_id, timestamp in statuses:
+            owner_ids = [author_id]
+            if author_id in fan_out_ids:
+                owner_ids += friends.get(author_id, ())
+            batch += [
+                cls(owner_id=owner_id, status_message_id=pk, author_id=author_id, timestamp=timestamp)
+                for owner_id in owner_ids
+            ]
+            if len(batch) >= batch_size:
+                cls.objects.bulk_create(batch, batch_size=batch_size)
+                written += len(batch)
+                batch = []
+        cls.objects.bulk_create(batch, batch_size=batch_size)
+        return written + len(batch)
+
+
 class Friend(models.Model):
     """
     represents a friendship connection between 2 profiles
@@ -144,4 +378,91 @@ class Friend(models.Model):
         Ensure that the combination of profile1 and profile2 is unique
         Prevents duplicate friendships like (A, B) and (A, B) from being created"
         """
-        unique_together = ('profile1', 'profile2')
\ No newline at end of file
+        unique_together = ('profile1', 'profile2')
+
+
+def invalidate_friend_caches(profile_ids, chunk_size=400):
+    """
+    Once the current transaction commits, drops the cached friend-id arrays of
+    `profile_ids` and the cached suggestions of everyone whose friends-of-friends
+    a friendship change around them affects: the profiles and each of their
+    friends. The friends are read with a direct query, not through the cache,
+    so nothing is cached again before the new edges are visible.
+    """
+    profile_ids = set(profile_ids)
+
+    def invalidate():
+        ids = sorted(profile_ids)
+        affected = set(ids)
+        # Chunked to stay under SQLite's 999 query parameters
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            for pair in Friend.objects.filter(
+                models.Q(profile1_id__in=chunk) | models.Q(profile2_id__in=chunk)
+            ).values_list('profile1_id', 'profile2_id'):
+                affected.update(pair)
+        cache.delete_many([FRIEND_IDS_CACHE_KEY.format(pk) for pk in ids]
+                          + [FRIEND_SUGGESTIONS_CACHE_KEY.format(pk) for pk in affected])
+
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Friend)
+def invalidate_friend_ids(sender, instance, **kwargs):
+    """
+    Invalidates the cached friend ids and suggestions around a saved or
+    deleted friendship once the transaction commits.
+    """
+    invalidate_friend_caches((instance.profile1_id, instance.profile2_id))
+
+
+@receiver(post_save, sender=StatusMessage)
+def fan_out_status_message(sender, instance, created, **kwargs):
+    """
+    Pushes a newly posted status message into the news feed timelines.
+    Deleted status messages leave the timelines through the FeedEntry cascade.
+    """
+    if created:
+        FeedEntry.fan_out(instance)
+
+
+@receiver(post_save, sender=Profile)
+def backfill_feeds_on_fan_out(sender, instance, created, **kwargs):
+    """
+    When a profile is switched back to fan-out mode its old posts are no
+    longer pulled at read time, so they are copied into its friends' timelines.
+    The copy grows with the profile's degree and history, so it runs after the
+    save has committed rather than inside the saving transaction.
+    """
+    if not created and instance.feed_fan_out and getattr(instance, '_loaded_feed_fan_out', True) is False:
+        transaction.on_commit(lambda: FeedEntry.backfill_author(instance))
+    instance._loaded_feed_fan_out = instance.feed_fan_out
+
+
+@receiver(post_save, sender=Friend)
+def add_friendship_to_feeds(sender, instance, created, **kwargs):
+    """
+    Backfills both news feeds with the new friend's recent status messages,
+    once the friendship has committed.
+    """
+    if created:
+        transaction.on_commit(lambda: FeedEntry.add_friendship(instance.profile1, instance.profile2))
+
+
+@receiver(post_delete, sender=Friend)
+def remove_friendship_from_feeds(sender, instance, **kwargs):
+    """
+    Retracts an ex-friend's status messages from both news feeds.
+    """
+    FeedEntry.remove_friendship(instance.profile1_id, instance.profile2_id)
+
+
+@receiver(post_save, sender=Image)
+def generate_image_variants(sender, instance, **kwargs):
+    """
+    Queues the resized copies (thumbnails) of a newly uploaded status image,
+    once it is committed.
+    """
+    from circuits.image_variants import generate_variants_async
+    image_file = instance.image_file
+    transaction.on_commit(lambda: generate_variants_async([image_file]))
@@ -1,3 +1,49 @@
+"""
+tests.py
+
+Query budget tests for the Mini Facebook application: every page is rendered
+against generated datasets of two sizes and must run the same number of SQL
+queries on both (see circuits.tests.QueryBudgetMixin).
+
+Author: Li Ziyang (miclilzy@bu.edu)
+Date: 02/21/2025
+"""
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from circuits.tests import QueryBudgetMixin
+
+from . import urls as mini_fb_urls
+from .models import Profile, StatusMessage
+from .views import _news_feed_page
+
+
+class MiniFbQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urls_module = mini_fb_urls
+    exempt_urls = {'logout': 'logs the test client out; the page itself runs no queries'}
 
-# Create your tests here.
+    def budget_urls(self, user):
+        profile = Profile.objects.get(user=user)
+        status = StatusMessage.objects.create(profile=profile, message='Budget test.')
+        # Someone who is not a friend yet, so add_friend does its full work.
+        stranger = Profile.objects.exclude(pk__in=[profile.pk, *profile.get_friend_ids()]).order_by('-pk').first()
+        _, cursor = _news_feed_page(profile)
+        cache.clear()
+        return {
+            'show_all_profiles': reverse('show_all_profiles'),
+            'show_profile': reverse('show_profile', args=[stranger.pk]),
+            'my_profile': reverse('my_profile'),
+            'create_profile': reverse('create_profile'),
+            'update_profile': reverse('update_profile'),
+            'friend_suggestions': reverse('friend_suggestions'),
+            'news_feed': reverse('news_feed'),
+            'news_feed_page': f"{reverse('news_feed_page')}?cursor={cursor}",
+            'add_friend': reverse('add_friend', args=[stranger.pk]),
+            'create_status': reverse('create_status'),
+            'delete_status': reverse('delete_status', args=[status.pk]),
+            'update_status': reverse('update_status', args=[status.pk]),
+            'login': reverse('login'),
+            'logout_confirmation': reverse('logout_confirmation'),
+        }
@@ -10,7 +10,7 @@ Date: 02/21/2025
 
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from .views import AddFriendView, ShowAllProfileView, ShowFriendSuggestionsView, ShowMyProfileView, ShowNewsFeedView, ShowProfilePageView, CreateProfileView, CreateStatusMessageView, UpdateProfileView, DeleteStatusMessageView, UpdateStatusMessageView, LogoutConfirmationView # Import both views
+from .views import AddFriendView, ShowAllProfileView, ShowFriendSuggestionsView, ShowMyProfileView, ShowNewsFeedPageView, ShowNewsFeedView, ShowProfilePageView, CreateProfileView, CreateStatusMessageView, UpdateProfileView, DeleteStatusMessageView, UpdateStatusMessageView, LogoutConfirmationView # Import both views
 
 # URL patterns for the mini_fb application
 urlpatterns = [
@@ -23,6 +23,7 @@ urlpatterns = [
     path('profile/update/', UpdateProfileView.as_view(), name='update_profile'),
     path('profile/friend_suggestions/', ShowFriendSuggestionsView.as_view(), name='friend_suggestions'),
     path('profile/news_feed/', ShowNewsFeedView.as_view(), name='news_feed'),
+    path('profile/news_feed/page/', ShowNewsFeedPageView.as_view(), name='news_feed_page'),
     path('profile/add_friend/<int:other_pk>/', AddFriendView.as_view(), name='add_friend'),
     path('status/create_status/', CreateStatusMessageView.as_view(), name='create_status'),
     path('profile/my/', ShowMyProfileView.as_view(), name='my_profile'),
@@ -7,11 +7,17 @@ including the view to create new profiles.
 Author: Li Ziyang (miclilzy@bu.edu)
 Date: 02/21/2025
 """
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import Http404, HttpResponseBadRequest
 from django.shortcuts import render, redirect, get_object_or_404
+from circuits.pagination import InvalidCursor, encode_cursor, keyset_page
 from django.urls import reverse_lazy, reverse
 from django.views import View
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-from .models import Friend, Profile, StatusMessage, Image, StatusImage
+from .models import FeedEntry, Friend, Profile, StatusMessage, Image, StatusImage
 from .forms import CreateProfileForm, CreateStatusMessageForm, UpdateProfileForm
 from django.urls import reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -53,28 +59,20 @@ class ShowProfilePageView(DetailView):
         adds the list of friends to the profile page context
         """
         context = super().get_context_data(**kwargs)
-        profile = self.get_object()
+        profile = self.object
+        # images of every status in one query instead of one per status
+        context["status_messages"] = profile.get_status_messages().prefetch_related('statusimage_set__image')
         context["friends"] = profile.get_friends()  # Use the get_friends method
         # show at most 4 friends suggestions
-        context["suggested_friends_preview"] = profile.get_friend_suggestions()[:4] 
+        context["suggested_friends_preview"] = profile.get_friend_suggestions(limit=4) 
         return context
     
 # new view for the logged-in user
-class ShowMyProfileView(LoginRequiredMixin, DetailView):
-    model = Profile
-    template_name = "mini_fb/show_profile.html"
-    context_object_name = "profile"
+class ShowMyProfileView(LoginRequiredMixin, ShowProfilePageView):
 
     def get_object(self):
         return get_object_or_404(Profile, user=self.request.user)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        profile = self.get_object()
-        context["friends"] = profile.get_friends()
-        context["suggested_friends_preview"] = profile.get_friend_suggestions()[:4]
-        return context
-
     
 def create_profile(request):
     """
@@ -116,65 +114,89 @@ class CreateProfileView(LoginRequiredMixin, CreateView):
         """  
         return reverse("show_profile", kwargs={"pk": self.object.pk})
 
+# Upper bound on threads writing uploaded files to storage at once (all requests)
+UPLOAD_WORKERS = 4
+_upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='mini_fb-upload')
+
+
+def _save_uploads(files):
+    """
+    Writes uploaded files to storage concurrently and returns their storage names
+    (in upload order). If any write fails, the files already written are removed.
+    """
+    field = Image._meta.get_field('image_file')
+    futures = [
+        _upload_pool.submit(field.storage.save, field.generate_filename(None, f.name), f)
+        for f in files
+    ]
+    wait(futures)
+    errors = [future.exception() for future in futures if future.exception()]
+    names = [future.result() for future in futures if not future.exception()]
+    if errors:
+        for name in names:
+            field.storage.delete(name)
+        raise errors[0]
+    return names
+
+
 class CreateStatusMessageView(LoginRequiredMixin, CreateView):
     """
-    View to create a new StatusMessage for a given Profile.
+    View to create a new StatusMessage for the logged-in user's Profile.
     - Uses the `CreateStatusMessageForm`.
-    - Ensures the message is attached to the correct Profile.
+    - Uploaded images are written to storage in parallel, then the status,
+      Image and StatusImage rows are inserted in one transaction.
     - Redirects back to the profile page after submission.
     """
     model = StatusMessage
     form_class = CreateStatusMessageForm
     template_name = "mini_fb/create_status_form.html"
 
+    def get_profile(self):
+        """The status is always posted as the logged-in user."""
+        if not hasattr(self, 'profile'):
+            self.profile = get_object_or_404(Profile, user=self.request.user)
+        return self.profile
+
     def get_context_data(self, **kwargs):
         """Inject the profile object into the template context."""
         context = super().get_context_data(**kwargs)
-        context['profile'] = get_object_or_404(Profile, pk=self.kwargs['pk'])
+        context['profile'] = self.get_profile()
         return context
 
-    def form_valid(self, form):
-        """Attach the correct Profile to the status message before saving."""
-        profile = get_object_or_404(Profile, pk=self.kwargs['pk'])
-        form.instance.profile = profile
-        return super().form_valid(form)
-
-    def get_success_url(self):
-        """Redirect to the Profile page after successfully posting a status."""
-        return reverse('show_profile', kwargs={'pk': self.kwargs['pk']})
-    
     def form_valid(self, form):
         """Handles saving the StatusMessage and associated images."""
-        # Save the status message object
-        sm = form.save(commit=False)
-
-        # Associate with the correct profile
-        profile = get_object_or_404(Profile, pk=self.kwargs['pk'])
-        sm.profile = profile
-        sm.save()
-
-        print(f"StatusMessage created: {sm.message} (ID: {sm.id}) for Profile: {profile.first_name}")
-
-        # Process uploaded files
-        files = self.request.FILES.getlist('files')
-        print(f"Files uploaded: {files}")  # Debugging: Check if files are being received
-
-        for file in files:
-            # Create and save an Image object
-            img = Image(profile=profile, image_file=file)
-            img.save()
-            print(f"Saved Image: {img.image_file.url}")  # Debugging: Print saved image URL
-
-            # Create and save a StatusImage object
-            status_image = StatusImage(status_message=sm, image=img)
-            status_image.save()
-            print(f"Linked Image {img.image_file.url} to Status {sm.message}")
-
-        return super().form_valid(form)
+        profile = self.get_profile()
+        # Disk writes run concurrently, so the wait is about the largest file
+        names = _save_uploads(self.request.FILES.getlist('files'))
+
+        try:
+            with transaction.atomic():
+                sm = form.save(commit=False)
+                sm.profile = profile
+                sm.save()
+                self.object = sm
+
+                # Saved one by one to learn each id: SQLite returns none from a bulk
+                # insert, and names alone are ambiguous (identical uploads share one
+                # stored file). Each save also queues the image's thumbnails once
+                # the rows are committed (generate_image_variants).
+                images = [Image(profile=profile, image_file=name) for name in names]
+                for image in images:
+                    image.save()
+                StatusImage.objects.bulk_create(
+                    [StatusImage(status_message=sm, image=image) for image in images]
+                )
+        except Exception:
+            storage = Image._meta.get_field('image_file').storage
+            for name in names:
+                storage.delete(name)
+            raise
+
+        return redirect(self.get_success_url())
 
     def get_success_url(self):
         """redirect to the profile page after positing status"""
-        return reverse("show_profile", kwargs = {"pk": self.kwargs['pk']})
+        return reverse("show_profile", kwargs = {"pk": self.get_profile().pk})
 
 class UpdateProfileView(LoginRequiredMixin, UpdateView):
     """
@@ -192,6 +214,10 @@ class UpdateProfileView(LoginRequiredMixin, UpdateView):
     form_class = UpdateProfileForm
     template_name = "mini_fb/update_profile_form.html"
 
+    def get_object(self):
+        """Use Logged-in User Instead of pk"""
+        return get_object_or_404(Profile, user=self.request.user)
+
     def get_context_data(self, **kwargs):
         """Add UserCreationForm to the template context."""
         context = super().get_context_data(**kwargs)
@@ -265,14 +291,15 @@ class UpdateStatusMessageView(LoginRequiredMixin, UpdateView):
 
 class AddFriendView(LoginRequiredMixin, View):
     """
-    Handles adding a friend based on URL parameters.
+    Adds the Profile given by `other_pk` as a friend of the logged-in user's
+    Profile, then redirects back to the user's own profile page.
     """
 
-    def dispatch(self, request, pk, other_pk, *args, **kwargs):
-        profile = get_object_or_404(Profile, pk=pk)
+    def get(self, request, other_pk, *args, **kwargs):
+        profile = get_object_or_404(Profile, user=request.user)
         other_profile = get_object_or_404(Profile, pk=other_pk)
         profile.add_friend(other_profile)
-        return redirect('show_profile', pk=pk)  # Redirect to the profile page
+        return redirect('show_profile', pk=profile.pk)  # Redirect to the profile page
     
 class ShowFriendSuggestionsView(DetailView):
     """
@@ -284,7 +311,7 @@ class ShowFriendSuggestionsView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        profile = self.get_object()
+        profile = self.object
         context["suggested_friends"] = profile.get_friend_suggestions()
         return context
     
@@ -294,13 +321,57 @@ class ShowFriendSuggestionsView(DetailView):
             raise Http404("User must be logged in to view suggestions")
         return get_object_or_404(Profile, user=self.request.user)
     
+# Number of status messages per news feed page
+NEWS_FEED_PAGE_SIZE = 20
+# Keyset ordering of the news feed, newest first (ties broken by id). FeedEntry
+# copies the status timestamp, so both orderings take the same cursor values.
+NEWS_FEED_KEYS = ['-timestamp', '-id']
+TIMELINE_KEYS = ['-timestamp', '-status_message_id']
+
+
+def _news_feed_page(profile, cursor=None):
+    """
+    Returns one page of a profile's news feed as (status messages, next cursor).
+
+    The page is read from the profile's FeedEntry timeline index, merged with
+    the latest posts of any pull-mode friends, so each page costs a fixed
+    number of indexed queries however long the feed's history is.
+    Raises InvalidCursor for a malformed cursor.
+    """
+    entries, more = keyset_page(
+        FeedEntry.objects.filter(owner=profile).select_related('status_message__profile'),
+        TIMELINE_KEYS, cursor, NEWS_FEED_PAGE_SIZE,
+    )
+    statuses = [entry.status_message for entry in entries]
+
+    pull_ids = profile.get_pull_friend_ids()
+    if pull_ids:
+        pulled, more_pulled = keyset_page(
+            StatusMessage.objects.filter(profile_id__in=pull_ids).select_related('profile'),
+            NEWS_FEED_KEYS, cursor, NEWS_FEED_PAGE_SIZE,
+        )
+        # A friend switched to pull mode may still have older posts in the timeline
+        merged = {status.pk: status for status in statuses + pulled}
+        statuses = sorted(merged.values(), key=lambda s: (s.timestamp, s.pk), reverse=True)
+        more = more or more_pulled or len(statuses) > NEWS_FEED_PAGE_SIZE
+        statuses = statuses[:NEWS_FEED_PAGE_SIZE]
+
+    prefetch_related_objects(statuses, 'statusimage_set__image')
+    next_cursor = None
+    if more and statuses:
+        next_cursor = encode_cursor([statuses[-1].timestamp, statuses[-1].pk])
+    return statuses, next_cursor
+
+
 class ShowNewsFeedView(LoginRequiredMixin, DetailView):
     """
     View to display the news feed for a given Profile.
 
-    This view retrieves all StatusMessages posted by the profile itself 
-    and its friends (via the `get_news_feed()` method), and renders them 
-    in reverse chronological order on the news feed page.
+    This view retrieves StatusMessages posted by the profile itself
+    and its friends (via `_news_feed_page()`, which reads the profile's
+    FeedEntry timeline), and renders the first page of them in reverse
+    chronological order on the news feed page.
+    Later pages are fetched by ShowNewsFeedPageView as the user scrolls.
 
     Attributes:
         model (Profile): The Django model representing the user profile.
@@ -313,40 +384,43 @@ class ShowNewsFeedView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         """
-        Injects the news feed (status messages from self and friends) 
-        into the template context under 'news_feed'.
+        Injects one page of the news feed (status messages from self and friends)
+        into the template context under 'news_feed', with the cursor of the next
+        page under 'next_cursor'.
         
         Returns:
             dict: The context data passed to the template, including the profile and news_feed.
         """
         context = super().get_context_data(**kwargs)
-        profile = self.get_object()
-        context["news_feed"] = profile.get_news_feed()
+        profile = self.object
+        context["news_feed"], context["next_cursor"] = _news_feed_page(profile, self.get_cursor())
         return context
+
+    def get_cursor(self):
+        """The full page always starts at the newest status message."""
+        return None
     
     def get_object(self):
         """Use Logged-in User Instead of pk"""
         return get_object_or_404(Profile, user=self.request.user)
 
-class LogoutConfirmationView(TemplateView):
-    """Render the logout confirmation page."""
-    template_name = "mini_fb/logged_out.html"
 
-class AddFriendView(View):
-    def dispatch(self, request, *args, **kwargs):
-        # 获取当前用户的 Profile
-        user_profile = get_object_or_404(Profile, user=request.user)
-        # 在此处可以添加进一步判断：例如是否允许添加好友等
-        
-        # 将当前用户的 Profile 放入 self 中，供后续使用
-        self.profile = user_profile
-        return super().dispatch(request, *args, **kwargs)
+class ShowNewsFeedPageView(ShowNewsFeedView):
+    """
+    Returns the news feed page after the `cursor` query parameter as an HTML
+    fragment, used by the news feed's infinite scroll.
+    """
+    template_name = "mini_fb/news_feed_items.html"
+
+    def get_cursor(self):
+        return self.request.GET.get('cursor')
 
     def get(self, request, *args, **kwargs):
-        # 从 URL 中获取要添加好友的 Profile 的 ID
-        other_pk = kwargs.get('other_pk')
-        # 注意：直接用当前用户的 Profile 执行添加好友操作
-        # 假设你在 Profile 模型中已经定义了 add_friend 方法
-        target_profile = get_object_or_404(Profile, pk=other_pk)
-        self.profile.add_friend(target_profile)
-        return redirect('show_profile')
\ No newline at end of file
+        try:
+            return super().get(request, *args, **kwargs)
+        except InvalidCursor:
+            return HttpResponseBadRequest('Invalid cursor.')
+
+class LogoutConfirmationView(TemplateView):
+    """Render the logout confirmation page."""
+    template_name = "mini_fb/logged_out.html"